@@ -4,6 +4,8 @@ from trafficSimulator import *
 sim = Simulation()
 
 n = 15
+curved = False  # One curved road per turn instead of n straight ones
+if curved: n = 1
 l = 200
 a = 10
 b = 50
@@ -92,28 +94,28 @@ sim.create_roads([
     (NORTH_RIGHT_MERGE, NORTH_RIGHT_TURN),
     (NORTH_LEFT_TURN, NORTH_LEFT_MERGE),
 
-    *curve_road(SOUTH_RIGHT, SOUTH_RIGHT_IN, (a, b-c/2), resolution=n),
-    *curve_road(SOUTH_RIGHT_OUT, SOUTH_RIGHT_MIDDLE, (-a, b-c-c/2), resolution=n),
-    *curve_road(NORTH_RIGHT_MIDDLE, NORTH_RIGHT_OUT, (-a, -b+c+c/2), resolution=n),
-    *curve_road(NORTH_RIGHT_IN, NORTH_LEFT, (a, -b+c/2), resolution=n),
+    *curve_road(SOUTH_RIGHT, SOUTH_RIGHT_IN, (a, b-c/2), resolution=n, curved=curved),
+    *curve_road(SOUTH_RIGHT_OUT, SOUTH_RIGHT_MIDDLE, (-a, b-c-c/2), resolution=n, curved=curved),
+    *curve_road(NORTH_RIGHT_MIDDLE, NORTH_RIGHT_OUT, (-a, -b+c+c/2), resolution=n, curved=curved),
+    *curve_road(NORTH_RIGHT_IN, NORTH_LEFT, (a, -b+c/2), resolution=n, curved=curved),
 
-    *curve_road(SOUTH_RIGHT, SOUTH_RIGHT_TURN, (SOUTH_RIGHT[0], SOUTH_MIDDLE[1]), resolution=n),
-    *curve_road(SOUTH_LEFT_MIDDLE, SOUTH_RIGHT_TURN, (SOUTH_RIGHT[0], SOUTH_MIDDLE[1]), resolution=n),
+    *curve_road(SOUTH_RIGHT, SOUTH_RIGHT_TURN, (SOUTH_RIGHT[0], SOUTH_MIDDLE[1]), resolution=n, curved=curved),
+    *curve_road(SOUTH_LEFT_MIDDLE, SOUTH_RIGHT_TURN, (SOUTH_RIGHT[0], SOUTH_MIDDLE[1]), resolution=n, curved=curved),
 
-    *curve_road(NORTH_RIGHT_TURN, NORTH_LEFT, (NORTH_LEFT[0], NORTH_MIDDLE[1]), resolution=n),
-    *curve_road(NORTH_RIGHT_TURN, NORTH_LEFT_MIDDLE, (NORTH_LEFT[0], NORTH_MIDDLE[1]), resolution=n),
+    *curve_road(NORTH_RIGHT_TURN, NORTH_LEFT, (NORTH_LEFT[0], NORTH_MIDDLE[1]), resolution=n, curved=curved),
+    *curve_road(NORTH_RIGHT_TURN, NORTH_LEFT_MIDDLE, (NORTH_LEFT[0], NORTH_MIDDLE[1]), resolution=n, curved=curved),
 
 
-    *curve_road(SOUTH_LEFT_IN, SOUTH_LEFT, (-a, b-c/2), resolution=n),
-    *curve_road(SOUTH_LEFT_MIDDLE, SOUTH_LEFT_OUT, (a, b-c-c/2), resolution=n),
-    *curve_road(NORTH_LEFT_OUT, NORTH_LEFT_MIDDLE, (a, -b+c+c/2), resolution=n),
-    *curve_road(NORTH_RIGHT, NORTH_LEFT_IN, (-a, -b+c/2), resolution=n),
+    *curve_road(SOUTH_LEFT_IN, SOUTH_LEFT, (-a, b-c/2), resolution=n, curved=curved),
+    *curve_road(SOUTH_LEFT_MIDDLE, SOUTH_LEFT_OUT, (a, b-c-c/2), resolution=n, curved=curved),
+    *curve_road(NORTH_LEFT_OUT, NORTH_LEFT_MIDDLE, (a, -b+c+c/2), resolution=n, curved=curved),
+    *curve_road(NORTH_RIGHT, NORTH_LEFT_IN, (-a, -b+c/2), resolution=n, curved=curved),
     
-    *curve_road(SOUTH_LEFT_TURN, SOUTH_LEFT, (SOUTH_LEFT[0], SOUTH_MIDDLE[1]), resolution=n),
-    *curve_road(SOUTH_LEFT_TURN, SOUTH_RIGHT_MIDDLE, (SOUTH_LEFT[0], SOUTH_MIDDLE[1]), resolution=n),
+    *curve_road(SOUTH_LEFT_TURN, SOUTH_LEFT, (SOUTH_LEFT[0], SOUTH_MIDDLE[1]), resolution=n, curved=curved),
+    *curve_road(SOUTH_LEFT_TURN, SOUTH_RIGHT_MIDDLE, (SOUTH_LEFT[0], SOUTH_MIDDLE[1]), resolution=n, curved=curved),
     
-    *curve_road(NORTH_RIGHT, NORTH_LEFT_TURN, (NORTH_RIGHT[0], NORTH_MIDDLE[1]), resolution=n),
-    *curve_road(NORTH_RIGHT_MIDDLE, NORTH_LEFT_TURN, (NORTH_RIGHT[0], NORTH_MIDDLE[1]), resolution=n),
+    *curve_road(NORTH_RIGHT, NORTH_LEFT_TURN, (NORTH_RIGHT[0], NORTH_MIDDLE[1]), resolution=n, curved=curved),
+    *curve_road(NORTH_RIGHT_MIDDLE, NORTH_LEFT_TURN, (NORTH_RIGHT[0], NORTH_MIDDLE[1]), resolution=n, curved=curved),
 
 ])
 
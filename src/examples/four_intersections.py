@@ -6,6 +6,8 @@ sim = MultithreadSimulation()
 
 # Play with these
 n = 25
+curved = False  # One curved road per turn instead of n straight ones
+if curved: n = 1
 a = 2
 b = 8
 l = 40
@@ -102,41 +104,41 @@ I3_I4 = (I3_RIGHT_BOT, I4_LEFT_BOT)
 I4_I3 = (I4_LEFT_TOP, I3_RIGHT_TOP)
 
 # Turns
-I1_LEFT_RIGHT_TURN = turn_road(I1_LEFT_BOT, I1_BOT_LEFT, TURN_RIGHT, n)
-I1_LEFT_LEFT_TURN = turn_road(I1_LEFT_BOT, I1_TOP_RIGHT, TURN_LEFT, n)
-I1_BOTTOM_RIGHT_TURN = turn_road(I1_BOT_RIGHT, I1_RIGHT_BOT, TURN_RIGHT, n)
-I1_BOTTOM_LEFT_TURN = turn_road(I1_BOT_RIGHT, I1_LEFT_TOP, TURN_LEFT, n)
-I1_RIGHT_RIGHT_TURN = turn_road(I1_RIGHT_TOP, I1_TOP_RIGHT, TURN_RIGHT, n)
-I1_RIGHT_LEFT_TURN = turn_road(I1_RIGHT_TOP, I1_BOT_LEFT, TURN_LEFT, n)
-I1_TOP_RIGHT_TURN = turn_road(I1_TOP_LEFT, I1_LEFT_TOP, TURN_RIGHT, n)
-I1_TOP_LEFT_TURN = turn_road(I1_TOP_LEFT, I1_RIGHT_BOT, TURN_LEFT, n)
-
-I2_LEFT_RIGHT_TURN = turn_road(I2_LEFT_BOT, I2_BOT_LEFT, TURN_RIGHT, n)
-I2_LEFT_LEFT_TURN = turn_road(I2_LEFT_BOT, I2_TOP_RIGHT, TURN_LEFT, n)
-I2_BOTTOM_RIGHT_TURN = turn_road(I2_BOT_RIGHT, I2_RIGHT_BOT, TURN_RIGHT, n)
-I2_BOTTOM_LEFT_TURN = turn_road(I2_BOT_RIGHT, I2_LEFT_TOP, TURN_LEFT, n)
-I2_RIGHT_RIGHT_TURN = turn_road(I2_RIGHT_TOP, I2_TOP_RIGHT, TURN_RIGHT, n)
-I2_RIGHT_LEFT_TURN = turn_road(I2_RIGHT_TOP, I2_BOT_LEFT, TURN_LEFT, n)
-I2_TOP_RIGHT_TURN = turn_road(I2_TOP_LEFT, I2_LEFT_TOP, TURN_RIGHT, n)
-I2_TOP_LEFT_TURN = turn_road(I2_TOP_LEFT, I2_RIGHT_BOT, TURN_LEFT, n)
-
-I3_LEFT_RIGHT_TURN = turn_road(I3_LEFT_BOT, I3_BOT_LEFT, TURN_RIGHT, n)
-I3_LEFT_LEFT_TURN = turn_road(I3_LEFT_BOT, I3_TOP_RIGHT, TURN_LEFT, n)
-I3_BOTTOM_RIGHT_TURN = turn_road(I3_BOT_RIGHT, I3_RIGHT_BOT, TURN_RIGHT, n)
-I3_BOTTOM_LEFT_TURN = turn_road(I3_BOT_RIGHT, I3_LEFT_TOP, TURN_LEFT, n)
-I3_RIGHT_RIGHT_TURN = turn_road(I3_RIGHT_TOP, I3_TOP_RIGHT, TURN_RIGHT, n)
-I3_RIGHT_LEFT_TURN = turn_road(I3_RIGHT_TOP, I3_BOT_LEFT, TURN_LEFT, n)
-I3_TOP_RIGHT_TURN = turn_road(I3_TOP_LEFT, I3_LEFT_TOP, TURN_RIGHT, n)
-I3_TOP_LEFT_TURN = turn_road(I3_TOP_LEFT, I3_RIGHT_BOT, TURN_LEFT, n)
-
-I4_LEFT_RIGHT_TURN = turn_road(I4_LEFT_BOT, I4_BOT_LEFT, TURN_RIGHT, n)
-I4_LEFT_LEFT_TURN = turn_road(I4_LEFT_BOT, I4_TOP_RIGHT, TURN_LEFT, n)
-I4_BOTTOM_RIGHT_TURN = turn_road(I4_BOT_RIGHT, I4_RIGHT_BOT, TURN_RIGHT, n)
-I4_BOTTOM_LEFT_TURN = turn_road(I4_BOT_RIGHT, I4_LEFT_TOP, TURN_LEFT, n)
-I4_RIGHT_RIGHT_TURN = turn_road(I4_RIGHT_TOP, I4_TOP_RIGHT, TURN_RIGHT, n)
-I4_RIGHT_LEFT_TURN = turn_road(I4_RIGHT_TOP, I4_BOT_LEFT, TURN_LEFT, n)
-I4_TOP_RIGHT_TURN = turn_road(I4_TOP_LEFT, I4_LEFT_TOP, TURN_RIGHT, n)
-I4_TOP_LEFT_TURN = turn_road(I4_TOP_LEFT, I4_RIGHT_BOT, TURN_LEFT, n)
+I1_LEFT_RIGHT_TURN = turn_road(I1_LEFT_BOT, I1_BOT_LEFT, TURN_RIGHT, n, curved)
+I1_LEFT_LEFT_TURN = turn_road(I1_LEFT_BOT, I1_TOP_RIGHT, TURN_LEFT, n, curved)
+I1_BOTTOM_RIGHT_TURN = turn_road(I1_BOT_RIGHT, I1_RIGHT_BOT, TURN_RIGHT, n, curved)
+I1_BOTTOM_LEFT_TURN = turn_road(I1_BOT_RIGHT, I1_LEFT_TOP, TURN_LEFT, n, curved)
+I1_RIGHT_RIGHT_TURN = turn_road(I1_RIGHT_TOP, I1_TOP_RIGHT, TURN_RIGHT, n, curved)
+I1_RIGHT_LEFT_TURN = turn_road(I1_RIGHT_TOP, I1_BOT_LEFT, TURN_LEFT, n, curved)
+I1_TOP_RIGHT_TURN = turn_road(I1_TOP_LEFT, I1_LEFT_TOP, TURN_RIGHT, n, curved)
+I1_TOP_LEFT_TURN = turn_road(I1_TOP_LEFT, I1_RIGHT_BOT, TURN_LEFT, n, curved)
+
+I2_LEFT_RIGHT_TURN = turn_road(I2_LEFT_BOT, I2_BOT_LEFT, TURN_RIGHT, n, curved)
+I2_LEFT_LEFT_TURN = turn_road(I2_LEFT_BOT, I2_TOP_RIGHT, TURN_LEFT, n, curved)
+I2_BOTTOM_RIGHT_TURN = turn_road(I2_BOT_RIGHT, I2_RIGHT_BOT, TURN_RIGHT, n, curved)
+I2_BOTTOM_LEFT_TURN = turn_road(I2_BOT_RIGHT, I2_LEFT_TOP, TURN_LEFT, n, curved)
+I2_RIGHT_RIGHT_TURN = turn_road(I2_RIGHT_TOP, I2_TOP_RIGHT, TURN_RIGHT, n, curved)
+I2_RIGHT_LEFT_TURN = turn_road(I2_RIGHT_TOP, I2_BOT_LEFT, TURN_LEFT, n, curved)
+I2_TOP_RIGHT_TURN = turn_road(I2_TOP_LEFT, I2_LEFT_TOP, TURN_RIGHT, n, curved)
+I2_TOP_LEFT_TURN = turn_road(I2_TOP_LEFT, I2_RIGHT_BOT, TURN_LEFT, n, curved)
+
+I3_LEFT_RIGHT_TURN = turn_road(I3_LEFT_BOT, I3_BOT_LEFT, TURN_RIGHT, n, curved)
+I3_LEFT_LEFT_TURN = turn_road(I3_LEFT_BOT, I3_TOP_RIGHT, TURN_LEFT, n, curved)
+I3_BOTTOM_RIGHT_TURN = turn_road(I3_BOT_RIGHT, I3_RIGHT_BOT, TURN_RIGHT, n, curved)
+I3_BOTTOM_LEFT_TURN = turn_road(I3_BOT_RIGHT, I3_LEFT_TOP, TURN_LEFT, n, curved)
+I3_RIGHT_RIGHT_TURN = turn_road(I3_RIGHT_TOP, I3_TOP_RIGHT, TURN_RIGHT, n, curved)
+I3_RIGHT_LEFT_TURN = turn_road(I3_RIGHT_TOP, I3_BOT_LEFT, TURN_LEFT, n, curved)
+I3_TOP_RIGHT_TURN = turn_road(I3_TOP_LEFT, I3_LEFT_TOP, TURN_RIGHT, n, curved)
+I3_TOP_LEFT_TURN = turn_road(I3_TOP_LEFT, I3_RIGHT_BOT, TURN_LEFT, n, curved)
+
+I4_LEFT_RIGHT_TURN = turn_road(I4_LEFT_BOT, I4_BOT_LEFT, TURN_RIGHT, n, curved)
+I4_LEFT_LEFT_TURN = turn_road(I4_LEFT_BOT, I4_TOP_RIGHT, TURN_LEFT, n, curved)
+I4_BOTTOM_RIGHT_TURN = turn_road(I4_BOT_RIGHT, I4_RIGHT_BOT, TURN_RIGHT, n, curved)
+I4_BOTTOM_LEFT_TURN = turn_road(I4_BOT_RIGHT, I4_LEFT_TOP, TURN_LEFT, n, curved)
+I4_RIGHT_RIGHT_TURN = turn_road(I4_RIGHT_TOP, I4_TOP_RIGHT, TURN_RIGHT, n, curved)
+I4_RIGHT_LEFT_TURN = turn_road(I4_RIGHT_TOP, I4_BOT_LEFT, TURN_LEFT, n, curved)
+I4_TOP_RIGHT_TURN = turn_road(I4_TOP_LEFT, I4_LEFT_TOP, TURN_RIGHT, n, curved)
+I4_TOP_LEFT_TURN = turn_road(I4_TOP_LEFT, I4_RIGHT_BOT, TURN_LEFT, n, curved)
 
 # Straights
 I1_HORIZ_TOP = (I1_RIGHT_TOP,I1_LEFT_TOP)
@@ -7,6 +7,8 @@ sim = Simulation()
 
 # Curve resolution
 n = 15
+curved = False  # One curved road per turn instead of n straight ones
+if curved: n = 1
 
 # Add multiple roads
 sim.create_roads([
@@ -20,7 +22,7 @@ sim.create_roads([
     ((101, 90), (80, 94)),
     ((160, 90), (100, 90)),
 
-    *curve_road((250, 10), (160, 90), (210, 90), resolution=n)
+    *curve_road((250, 10), (160, 90), (210, 90), resolution=n, curved=curved)
 ])
 
 sim.create_gen({
@@ -7,6 +7,8 @@ sim = Simulation()
 
 # Play with these
 n = 15
+curved = False  # One curved road per turn instead of n straight ones
+if curved: n = 1
 a = 2
 b = 20
 c = 5
@@ -59,15 +61,15 @@ SOUTH_LEFT_TURN = (WEST, SOUTH_LEFT)
 EAST_LEFT_TURN = (SOUTH, EAST_LEFT)
 NORTH_LEFT_TURN = (EAST, NORTH_LEFT)
 
-WEST_RIGHT_TURN = curve_road(WEST_RIGHT, WEST, (WEST[0], WEST_RIGHT[1]), resolution=n)
-SOUTH_RIGHT_TURN = curve_road(SOUTH_RIGHT, SOUTH, (SOUTH_RIGHT[0], SOUTH[1]), resolution=n)
-EAST_RIGHT_TURN = curve_road(EAST_RIGHT, EAST, (EAST[0], EAST_RIGHT[1]), resolution=n)
-NORTH_RIGHT_TURN = curve_road(NORTH_RIGHT, NORTH, (NORTH_RIGHT[0], NORTH[1]), resolution=n)
+WEST_RIGHT_TURN = curve_road(WEST_RIGHT, WEST, (WEST[0], WEST_RIGHT[1]), resolution=n, curved=curved)
+SOUTH_RIGHT_TURN = curve_road(SOUTH_RIGHT, SOUTH, (SOUTH_RIGHT[0], SOUTH[1]), resolution=n, curved=curved)
+EAST_RIGHT_TURN = curve_road(EAST_RIGHT, EAST, (EAST[0], EAST_RIGHT[1]), resolution=n, curved=curved)
+NORTH_RIGHT_TURN = curve_road(NORTH_RIGHT, NORTH, (NORTH_RIGHT[0], NORTH[1]), resolution=n, curved=curved)
 
-WEST_SOUTH = curve_road(WEST, SOUTH, (WEST[0], SOUTH[1]), resolution=n)
-SOUTH_EAST = curve_road(SOUTH, EAST, (EAST[0], SOUTH[1]), resolution=n)
-EAST_NORTH = curve_road(EAST, NORTH, (EAST[0], NORTH[1]), resolution=n)
-NORTH_WEST = curve_road(NORTH, WEST, (WEST[0], NORTH[1]), resolution=n)
+WEST_SOUTH = curve_road(WEST, SOUTH, (WEST[0], SOUTH[1]), resolution=n, curved=curved)
+SOUTH_EAST = curve_road(SOUTH, EAST, (EAST[0], SOUTH[1]), resolution=n, curved=curved)
+EAST_NORTH = curve_road(EAST, NORTH, (EAST[0], NORTH[1]), resolution=n, curved=curved)
+NORTH_WEST = curve_road(NORTH, WEST, (WEST[0], NORTH[1]), resolution=n, curved=curved)
 
 sim.create_roads([
     WEST_INBOUND,
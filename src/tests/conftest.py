@@ -0,0 +1,2 @@
+# test_1/2/3 are example scripts that open a Window when imported
+collect_ignore = ["test_1.py", "test_2.py", "test_3.py"]
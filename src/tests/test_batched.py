@@ -0,0 +1,48 @@
+import numpy as np
+
+from src.trafficSimulator import *
+
+ROADS = [
+    ((0, 100), (148, 100)), ((148, 100), (300, 100)), ((150, 0), (150, 98)), ((150, 98), (150, 200)),
+    *curve_road((148, 100), (150, 98), (150, 100), curved=True)
+]
+GENERATOR = {'vehicle_rate': 40, 'vehicles': [
+    [1, {"path": [0, 1]}], [1, {"path": [2, 3]}], [1, {"path": [0, 4, 3], "v_max": 12}]
+]}
+
+
+def test_replicas_match_seeded_simulations():
+    batch = BatchedSimulation({"batch_size": 4, "seed": 5})
+    batch.create_roads(ROADS)
+    batch.create_gen(GENERATOR)
+    batch.create_signal([[0], [2]])
+    batch.reset()
+
+    # Every replica holds its own phase for a while and then switches
+    phases = np.array([[b % 2] for b in range(4)])
+    steps = []
+    for step in range(5):
+        _, rewards, _ = batch.step(phases if step < 3 else 1 - phases)
+        positions = [
+            [list(batch.arrays['x'][b, r, :batch.count[b, r]]) for r in range(len(ROADS))] for b in range(4)
+        ]
+        steps.append((positions, rewards.copy()))
+
+    for b in range(4):
+        sim = Simulation({"id": 1, "seed": batch.replica_seed(b)})
+        sim.create_roads(ROADS)
+        sim.create_gen(GENERATOR)
+        sim.create_signal([[0], [2]])
+        agent, signal = sim.agents[0], sim.traffic_signals[0]
+        agent.update = lambda: None
+        for step, (positions, rewards) in enumerate(steps):
+            phase = int(phases[b, 0] if step < 3 else 1 - phases[b, 0])
+            agent.act = lambda phase=phase: setattr(signal, 'current_cycle_index', phase)
+            signal.current_cycle_index = phase
+            sim.run(int(round(batch.decision_interval / sim.dt)))
+
+            for road, xs in zip(sim.roads, positions[b]):
+                assert len(road.vehicles) == len(xs)
+                assert np.allclose([v.x for v in road.vehicles], xs, atol=1e-9)
+            if sim.metrics["collisions"] == 0:
+                assert np.isclose(sim.metrics["avg_speed"], rewards[b])
@@ -0,0 +1,58 @@
+import os
+import pickle
+
+from src.trafficSimulator.learning.checkpoint import QTableCheckpoint
+from src.trafficSimulator.learning.qtable import QTableDict
+
+
+def test_legacy_pickle_is_keyed_by_state_key(tmp_path):
+    path = str(tmp_path / 'qtable0')
+    with open(f'{path}.pickle', 'wb') as file:
+        pickle.dump({(str([[(0, 1), (2, 3)], [1]]), 0): 1.5, ("[[(0,", 1): 2.0}, file)
+
+    q_table = QTableCheckpoint(path, [0, 1]).restore_dict()
+    assert q_table == {((((0, 1), (2, 3)), (1,)), 0): 1.5}
+
+    # Saved to the log and read back without the pickle
+    checkpoint = QTableCheckpoint(path, [0, 1])
+    checkpoint.save(q_table)
+    q_table = QTableCheckpoint(path, [0, 1]).restore_dict()
+    assert q_table[(((0, 1), (2, 3)), (1,)), 0] == 1.5
+
+
+def test_torn_states_record_is_dropped_before_the_next_save(tmp_path):
+    # Torn pickles fail to load in different ways depending on where they end
+    for cut in range(1, 26):
+        path = str(tmp_path / f'qtable{cut}')
+        checkpoint = QTableCheckpoint(path, [0, 1])
+        checkpoint.save({((1,), 0): 1.0, ((2,), 0): 2.0})
+
+        # A crash in the middle of writing the last state
+        os.truncate(f'{path}.states', os.path.getsize(f'{path}.states') - cut)
+
+        checkpoint = QTableCheckpoint(path, [0, 1])
+        assert checkpoint.restore_dict() == {((1,), 0): 1.0, ((1,), 1): 0.0}
+        checkpoint.save({((2,), 0): 2.0, ((3,), 1): 3.0})
+
+        q_table = QTableCheckpoint(path, [0, 1]).restore_dict()
+        assert q_table[(2,), 0] == 2.0
+        assert q_table[(3,), 1] == 3.0
+
+
+def test_qtable_dict_saves_only_written_keys(tmp_path):
+    path = str(tmp_path / 'qtable0')
+    checkpoint = QTableCheckpoint(path, [0, 1])
+    table = QTableDict({((1,), 0): 1.0, ((1,), 1): 4.0})
+    checkpoint.save(dict(table))
+    table[(2,), 0] = 2.0
+    table[(1,), 0] = 5.0
+    assert sorted(table.pop_dirty()) == [(((1,), 0), 5.0), (((2,), 0), 2.0)]
+
+    table[(1,), 0] = 6.0
+    checkpoint.save(table)
+    assert table.pop_dirty() == []
+
+    # The action that was not written keeps its saved value
+    q_table = QTableCheckpoint(path, [0, 1]).restore_dict()
+    assert q_table[(1,), 0] == 6.0
+    assert q_table[(1,), 1] == 4.0
@@ -0,0 +1,40 @@
+import numpy as np
+
+from src.trafficSimulator import *
+from src.trafficSimulator.collision import COLLISION_DETECTORS
+
+
+def test_fewer_than_two_vehicles():
+    for name, detector in COLLISION_DETECTORS.items():
+        detector = detector({"brute_force_below": 0}) if name == "spatial_hash" else detector()
+        for n in (0, 1):
+            i, j = detector.candidate_pairs(np.zeros((n, 2)))
+            assert len(i) == len(j) == 0
+            assert detector.detect(np.zeros((n, 2)), np.zeros(n, dtype=int)) == 0
+
+
+def test_detectors_agree_on_random_positions():
+    rng = np.random.default_rng(1)
+    for n in (2, 50, 500, 3000):
+        positions = rng.uniform(0, 60 if n < 1000 else 300, (n, 2))
+        road_ids = rng.integers(0, 5, n)
+        expected = BruteForceDetector().detect(positions, road_ids)
+        assert SpatialHashDetector().detect(positions, road_ids) == expected
+        assert SpatialHashDetector({"brute_force_below": 0}).detect(positions, road_ids) == expected
+
+
+def test_conflict_zones_find_the_same_collisions():
+    totals = []
+    for detection, conflict_zones in (("brute_force", False), ("spatial_hash", False), ("spatial_hash", True)):
+        sim = Simulation({"seed": 1, "collision_detection": detection, "conflict_zones": conflict_zones})
+        sim.create_roads([
+            ((0, 100), (148, 100)), ((148, 100), (300, 100)), ((150, 0), (150, 98)), ((150, 98), (150, 200)),
+            *curve_road((148, 100), (150, 98), (150, 100), resolution=5)
+        ])
+        sim.create_gen({'vehicle_rate': 60, 'vehicles': [
+            [1, {"path": [0, 1]}], [1, {"path": [2, 3]}], [1, {"path": [0, 4, 5, 6, 7, 8, 3]}]
+        ]})
+        sim.run(6000)
+        totals.append(sim.total_collisions)
+    assert totals[0] > 0
+    assert totals == [totals[0]] * 3
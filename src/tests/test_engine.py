@@ -0,0 +1,38 @@
+import numpy as np
+
+from src.trafficSimulator import *
+
+
+def make_simulation(engine):
+    sim = Simulation({"engine": engine, "seed": 1})
+    sim.create_roads([
+        ((300, 98), (0, 98)), ((0, 102), (300, 102)), ((180, 60), (0, 60)),
+        ((220, 55), (180, 60)), ((300, 30), (220, 55)), ((180, 60), (160, 98)),
+        ((0, 100), (148, 100)), ((148, 100), (300, 100)), ((150, 0), (150, 98)), ((150, 98), (150, 200)),
+        *curve_road((148, 100), (150, 98), (150, 100), resolution=5)
+    ])
+    sim.create_gen({'vehicle_rate': 80, 'vehicles': [
+        [1, {"path": [4, 3, 2]}], [1, {"path": [0]}], [1, {"path": [1]}],
+        [3, {"path": [6, 7]}], [3, {"path": [8, 9]}], [1, {"path": [6, 10, 11, 12, 13, 14, 9]}]
+    ]})
+    sim.create_signal([[6], [8]])
+    return sim
+
+
+def vehicle_states(sim):
+    return [[(v.id, v.x, v.v) for v in road.vehicles] for road in sim.roads]
+
+
+def test_vectorized_engine_matches_object_engine():
+    object_sim = make_simulation("object")
+    vectorized_sim = make_simulation("vectorized")
+    for step in range(3000):
+        object_sim.update()
+        vectorized_sim.update()
+        if step % 100 == 0:
+            expected, actual = vehicle_states(object_sim), vehicle_states(vectorized_sim)
+            assert [len(road) for road in actual] == [len(road) for road in expected]
+            for road_expected, road_actual in zip(expected, actual):
+                assert [s[0] for s in road_actual] == [s[0] for s in road_expected]
+                assert np.allclose([s[1:] for s in road_actual], [s[1:] for s in road_expected], atol=1e-6)
+    assert object_sim.metrics["collisions"] == vectorized_sim.metrics["collisions"]
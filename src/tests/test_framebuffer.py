@@ -0,0 +1,20 @@
+import numpy as np
+
+from src.trafficSimulator.framebuffer import SnapshotBuffer
+from src.trafficSimulator.snapshot import Snapshot
+
+
+def test_read_gives_up_on_a_slot_left_half_written():
+    buffer = SnapshotBuffer(capacity=4, signal_capacity=1)
+    try:
+        assert buffer.read() == (None, -1)
+        buffer.publish(Snapshot(1.0, 60, ids=np.array([7]), road_ids=np.array([0]), xs=np.array([5.0]), lengths=np.array([4.0])))
+        snapshot, version = buffer.read()
+        assert list(snapshot.ids) == [7]
+
+        # A writer that died in the middle of a publish
+        buffer.slots[int(buffer.header['latest'])]['sequence'] += 1
+        assert buffer.read() == (snapshot, version)
+    finally:
+        buffer.close()
+        buffer.unlink()
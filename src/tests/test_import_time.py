@@ -0,0 +1,43 @@
+import os
+import statistics
+import subprocess
+import sys
+
+# Import time of the headless core, each run in a fresh interpreter
+RUNS = 10
+RENDERING = ('pygame', 'matplotlib', 'scipy')
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+code = """
+import sys, time
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start, *[name for name in {rendering} if name in sys.modules])
+"""
+
+
+def import_time(module, runs=RUNS):
+    times = []
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, '-c', code.format(module=module, rendering=RENDERING)],
+            capture_output=True, text=True, check=True, cwd=ROOT
+        ).stdout.split()
+        times.append(float(out[0]))
+        loaded = out[1:]
+    return statistics.median(times), loaded
+
+
+def test_core_does_not_import_rendering():
+    _, loaded = import_time('src.trafficSimulator', runs=1)
+    assert not loaded, f'the core imported {", ".join(loaded)}'
+
+
+if __name__ == '__main__':
+    numpy_time, _ = import_time('numpy')
+    core_time, loaded = import_time('src.trafficSimulator')
+
+    print(f'numpy:          {numpy_time*1000:.1f} ms')
+    print(f'trafficSimulator: {core_time*1000:.1f} ms ({(core_time - numpy_time)*1000:.1f} ms without numpy)')
+
+    assert not loaded, f'the core imported {", ".join(loaded)}'
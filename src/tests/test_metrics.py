@@ -0,0 +1,55 @@
+from threading import Thread
+
+import numpy as np
+
+from src.trafficSimulator import *
+from src.trafficSimulator.metrics import MetricsLog, read_metrics_log
+
+
+def make_simulation():
+    sim = Simulation()
+    sim.create_roads([((0, 100), (148, 100)), ((150, 0), (150, 98))])
+    sim.create_gen({'vehicle_rate': 60, 'vehicles': [[1, {"path": [0]}], [1, {"path": [1]}]]})
+    sim.create_signal([[0], [1]])
+    sim.run(300)
+    return sim
+
+
+def test_mapping_interface():
+    sim = make_simulation()
+    metrics = sim.metrics
+
+    # Counters and views are read through the Mapping methods alike
+    assert list(metrics.values()) == [metrics[name] for name in metrics]
+    assert dict(metrics.items()) == dict(metrics)
+    assert metrics["avg_speed"] == dict(metrics)["avg_speed"]
+    assert "collisions" in metrics.keys()
+
+
+def test_state_key_is_not_a_metric():
+    sim = make_simulation()
+
+    assert "state_key" not in dict(sim.metrics)
+    # Computed once per frame
+    assert sim.state_key is sim.state_key
+
+
+def test_log_flushed_from_two_threads(tmp_path):
+    log = MetricsLog(str(tmp_path / 'metrics.log'), buffer_size=64)
+    done = []
+
+    def flush_until_done():
+        while not done:
+            log.flush()
+
+    flusher = Thread(target=flush_until_done)
+    flusher.start()
+    for i in range(20000):
+        log.append({"episodes": i})
+    done.append(True)
+    flusher.join()
+    log.flush()
+
+    # Every record written once
+    episodes = read_metrics_log(log.path)['episodes']
+    assert np.array_equal(np.sort(episodes), np.arange(20000))
@@ -0,0 +1,85 @@
+import time
+import warnings
+from multiprocessing import Process
+
+import numpy as np
+
+from src.trafficSimulator.learning.qtable import BufferedQTable, SharedQTable
+
+
+def test_full_shared_table_drops_new_states():
+    table = SharedQTable([0, 1], capacity=4)
+    try:
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            for i in range(10):
+                table[(i,), 1] = i
+
+        # The first states keep their values, the rest read as the default
+        assert [table[(i,), 1] for i in range(4)] == [0, 1, 2, 3]
+        assert table[(9,), 1] == 0
+        assert table.find((9,)) is None
+        assert len(caught) == 1
+    finally:
+        table.close()
+        table.unlink()
+
+
+def _add_ones(table, n):
+    for _ in range(n):
+        table.update(((0,), 1), lambda value: value + 1)
+
+
+def test_shared_updates_are_not_lost():
+    table = SharedQTable([0, 1], capacity=16)
+    try:
+        workers = [Process(target=_add_ones, args=(table, 2000)) for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        assert table[(0,), 1] == 8000
+    finally:
+        table.close()
+        table.unlink()
+
+
+def test_probe_of_a_full_table():
+    table = SharedQTable([0, 1], capacity=2**16)
+    try:
+        keys = np.arange(1, 2**16 + 2, dtype=np.uint64)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            table.load_rows(keys, np.zeros((len(keys), 2)))
+        assert table.full
+
+        # A miss scans the whole table, with numpy
+        start = time.perf_counter()
+        for i in range(20):
+            assert table.find(('missing', i)) is None
+        assert time.perf_counter() - start < 0.5
+        assert table.state_id(('missing', 0)) is None
+    finally:
+        table.close()
+        table.unlink()
+
+
+def _merge_ones(table, n):
+    buffered = BufferedQTable(table, strategy="sum_of_deltas")
+    for _ in range(n):
+        buffered.update(((0,), 1), lambda value: value + 1)
+        buffered.merge()
+
+
+def test_buffered_merges_into_shared_table_keep_every_delta():
+    table = SharedQTable([0, 1], capacity=16)
+    try:
+        workers = [Process(target=_merge_ones, args=(table, 1000)) for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        assert table[(0,), 1] == 4000
+    finally:
+        table.close()
+        table.unlink()
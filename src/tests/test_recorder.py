@@ -0,0 +1,43 @@
+import numpy as np
+
+from src.trafficSimulator import *
+
+
+def vehicle_states(sim):
+    """x, v and a of every vehicle in road order, as recorded"""
+    engine = sim.vehicle_engine
+    states = []
+    for road in sim.roads:
+        for vehicle in road.vehicles:
+            if engine is None:
+                states.append((vehicle.x, vehicle.v, vehicle.a))
+            else:
+                states.append(tuple(engine.arrays[name][vehicle.slot] for name in 'xva'))
+    return np.array(states, dtype=np.float32).reshape(-1, 3)
+
+
+def test_recording_round_trip(tmp_path):
+    sim = Simulation({"seed": 1})
+    sim.create_roads([((0, 0), (100, 0)), ((100, 0), (100, 100)), ((0, 100), (100, 0))])
+    sim.create_gen({'vehicle_rate': 60, 'vehicles': [[1, {"path": [0, 1]}], [1, {"path": [2, 1]}]]})
+    sim.create_signal([[0], [2]])
+    path = str(tmp_path / 'run.traj')
+    recorder = TrajectoryRecorder(path, {"chunk_steps": 97}).attach(sim)
+
+    expected = []
+    for _ in range(1000):
+        sim.update()
+        expected.append((Snapshot.capture(sim), vehicle_states(sim)))
+    recorder.close()
+
+    reader = TrajectoryReader(path)
+    assert len(reader) == 1000
+    columns = reader.read()
+    for step, (snapshot, states) in enumerate(expected):
+        frame = reader.frame(step)
+        assert np.array_equal(frame.ids, snapshot.ids)
+        assert np.array_equal(frame.road_ids, snapshot.road_ids)
+        assert np.array_equal(frame.signals, snapshot.signals)
+        assert frame.frame_count == snapshot.frame_count
+        rows = columns['step'] == step
+        assert np.array_equal(np.stack([columns[name][rows] for name in 'xva'], axis=1), states)
@@ -1,8 +1,20 @@
 from .curve import *
 from .vehicle import *
+from .engine import *
+from .lane import *
+from .network import *
 from .road import *
+from .collision import *
+from .metrics import *
+from .scenario import *
 from .simulation import *
+from .snapshot import *
+from .realtime import *
+from .batched import *
 from .window import *
 from .vehicle_generator import *
 from .traffic_signal import *
-from .multithread import *
\ No newline at end of file
+from .framebuffer import *
+from .recorder import *
+from .multithread import *
+from .sweep import *
@@ -0,0 +1,375 @@
+import numpy as np
+
+from .engine import FIELDS
+from .network import RoadNetwork
+from .vehicle import Vehicle
+from .vehicle_generator import VehicleGenerator
+from .traffic_signal import TrafficSignal
+from .collision import COLLISION_DETECTORS
+
+
+class BatchedSimulation:
+    """Replicas of one road network stepped together in arrays with a leading batch dimension.
+
+    The vehicles of replica b on road r are the slots [b, r, :count[b, r]] of
+    the arrays, head first. Every step sets the phase of every signal of every
+    replica and then runs *decision_interval* seconds of all of them at once."""
+    def __init__(self, config={}):
+        # Set default configuration
+        self.set_default_config()
+
+        # Update configuration
+        for attr, val in config.items():
+            setattr(self, attr, val)
+
+        # Calculate properties
+        self.init_properties()
+
+    def set_default_config(self):
+        self.batch_size = 16
+        self.dt = 1/60
+        self.decision_interval = 15     # Seconds simulated by one step
+        self.episode_length = 120       # Seconds after which a replica starts a new episode
+        self.max_collisions = 1         # A replica with more collisions starts a new episode
+        self.lane_capacity = 32         # Vehicles per road, doubled when a road is full
+        self.section_length = 20        # Length of the road sections counted in observations
+        self.seed = None                # Seeds the replicas, None gives every replica the same traffic
+        self.network = None             # RoadNetwork shared with other simulations, None for a new one
+        self.collision_detection = "spatial_hash"
+
+    def init_properties(self):
+        if self.network is None:
+            self.network = RoadNetwork()
+        self.generators = []
+        self.signals = []
+        self.paths = {}
+        self.arrays = None
+
+        if isinstance(self.collision_detection, str):
+            self.collision_detector = COLLISION_DETECTORS[self.collision_detection]()
+        else:
+            self.collision_detector = self.collision_detection
+
+    def create_road(self, start, end, control=None):
+        return self.network.add_road(start, end, control)
+
+    def create_roads(self, road_list):
+        for road in road_list:
+            self.create_road(*road)
+
+    def create_gen(self, config={}):
+        gen = VehicleGenerator(None, config)
+        weights = [weight for weight, _ in gen.vehicles]
+        templates = []
+        for _, vehicle_config in gen.vehicles:
+            vehicle = Vehicle(vehicle_config)
+            path = tuple(vehicle.path)
+            self.paths.setdefault(path, len(self.paths))
+            templates.append((
+                {name: getattr(vehicle, name) for name in FIELDS},
+                self.paths[path]
+            ))
+        self.generators.append({
+            "config": config,
+            "vehicle_rate": gen.vehicle_rate,
+            "seed": gen.seed,
+            "weights": weights,
+            "templates": templates
+        })
+
+    def create_signal(self, roads, lock=None, config={}):
+        # There are no Q-tables to lock, *lock* keeps the signature of Simulation.create_signal
+        self.network.add_signal(roads)
+        # A signal without roads only holds the configuration
+        self.signals.append(TrafficSignal([], config))
+
+    def replica_seed(self, b):
+        """Returns the seed of replica *b*, a Simulation with this seed has the same traffic"""
+        if self.seed is None:
+            return None
+        return int(np.random.SeedSequence([self.seed, b]).generate_state(1)[0])
+
+    def _generator_rng(self, g, b):
+        seed = self.replica_seed(b)
+        if seed is None:
+            return np.random.default_rng(self.generators[g]["seed"])
+        # The same stream as Simulation.child_seed(0, g)
+        return np.random.default_rng(int(np.random.SeedSequence([seed, 0, g]).generate_state(1)[0]))
+
+    @staticmethod
+    def _draw(rng, weights):
+        # Same draw as VehicleGenerator.generate_vehicle
+        r = rng.integers(1, sum(weights)+1)
+        for i, weight in enumerate(weights):
+            r -= weight
+            if r <= 0:
+                return i
+
+    def build(self):
+        """Allocates the arrays of every replica"""
+        B, R, K = self.batch_size, len(self.network), self.lane_capacity
+        self.network.freeze()
+        packed = self.network.packed
+        self.lengths = packed['lengths']
+
+        self.arrays = {
+            name: np.zeros((B, R, K), dtype=bool if name == 'stopped' else float)
+            for name in FIELDS
+        }
+        self.arrays['path'] = np.zeros((B, R, K), dtype=int)
+        self.arrays['path_pos'] = np.zeros((B, R, K), dtype=int)
+        self.count = np.zeros((B, R), dtype=int)
+
+        # Paths as a padded table of road indices
+        max_path = max([len(path) for path in self.paths] + [1])
+        self.path_table = np.full((len(self.paths), max_path), -1, dtype=int)
+        self.path_lengths = np.zeros(len(self.paths), dtype=int)
+        for path, i in self.paths.items():
+            self.path_table[i, :len(path)] = path
+            self.path_lengths[i] = len(path)
+
+        # Signal of every road and its parameters, roads without one are always green
+        S = len(self.signals)
+        self.road_signals = packed['signal_ids']
+        self.road_groups = packed['signal_groups']
+        cycles = max([len(signal.cycle) for signal in self.signals] + [1])
+        groups = max([len(signal.cycle[0]) for signal in self.signals] + [1])
+        self.green_table = np.ones((max(S, 1), cycles, groups), dtype=bool)
+        for s, signal in enumerate(self.signals):
+            self.green_table[s, :len(signal.cycle)] = np.array(signal.cycle, dtype=bool)
+
+        def per_road(name):
+            return np.array([
+                getattr(self.signals[s], name) if s >= 0 else 0 for s in self.road_signals
+            ], dtype=float)
+        self.slow_distances = per_road('slow_distance')
+        self.slow_factors = per_road('slow_factor')
+        self.stop_distances = per_road('stop_distance')
+        self.signal_road_mask = self.road_signals >= 0
+
+        self.t = np.zeros(B)
+        self.phases = np.zeros((B, S), dtype=int)
+        self.collisions = np.zeros(B, dtype=int)
+        self.episodes = np.zeros(B, dtype=int)
+
+        self.gen_rngs = [[None] * B for _ in self.generators]
+        self.gen_upcoming = np.zeros((len(self.generators), B), dtype=int)
+        self.gen_last_added = np.zeros((len(self.generators), B))
+
+        self.n_sections = int(np.ceil(self.lengths.max() / self.section_length)) + 1 if R else 1
+
+        # Gap between replicas so that their vehicles never collide
+        points = packed['lut_points']
+        self.replica_stride = (np.ptp(points[:, 0]) if len(points) else 0) + 10 * self.collision_detector.distance
+
+    def reset(self, replicas=None):
+        """Starts a new episode in *replicas*, by default all, and returns the observations"""
+        if self.arrays is None:
+            self.build()
+        replicas = np.arange(self.batch_size) if replicas is None else np.asarray(replicas, dtype=int)
+
+        self.count[replicas] = 0
+        self.t[replicas] = 0
+        self.phases[replicas] = 0
+        self.collisions[replicas] = 0
+        for g, gen in enumerate(self.generators):
+            self.gen_last_added[g, replicas] = 0
+            for b in replicas:
+                self.gen_rngs[g][b] = self._generator_rng(g, b)
+                self.gen_upcoming[g, b] = self._draw(self.gen_rngs[g][b], gen["weights"])
+
+        return self.observations()
+
+    def _grow(self):
+        K = self.lane_capacity
+        self.lane_capacity *= 2
+        for name, arr in self.arrays.items():
+            grown = np.zeros(arr.shape[:2] + (self.lane_capacity,), dtype=arr.dtype)
+            grown[..., :K] = arr
+            self.arrays[name] = grown
+
+    def _append(self, b, r, values):
+        """Adds a vehicle with the field *values* at the tail of road *r* of replica *b*"""
+        k = self.count[b, r]
+        if k == self.lane_capacity:
+            self._grow()
+        for name, val in values.items():
+            self.arrays[name][b, r, k] = val
+        self.count[b, r] += 1
+
+    def green(self):
+        """Returns a (replicas x roads) mask of the roads with a green light"""
+        signals = np.maximum(self.road_signals, 0)
+        phases = self.phases[:, signals] if self.signals else np.zeros((self.batch_size, len(signals)), dtype=int)
+        green = self.green_table[signals, phases, np.maximum(self.road_groups, 0)]
+        return green | ~self.signal_road_mask
+
+    def _update_vehicles(self, green):
+        n = self.count.max()
+        if n == 0:
+            return
+        arrays = {name: arr[..., :n] for name, arr in self.arrays.items()}
+        x, v, a = arrays['x'], arrays['v'], arrays['a']
+        l, s0, T = arrays['l'], arrays['s0'], arrays['T']
+        v_max, a_max, b_max = arrays['v_max'], arrays['a_max'], arrays['b_max']
+        sqrt_ab, stopped = arrays['sqrt_ab'], arrays['stopped']
+        dt = self.dt
+
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            # Update position and velocity
+            clamp = v + a*dt < 0
+            new_v = np.where(clamp, 0, v + a*dt)
+            x[...] = np.where(clamp, x - 1/2*v*v/a, x + new_v*dt + a*dt*dt/2)
+            v[...] = new_v
+
+            # Update acceleration, the vehicle in slot k follows the one in slot k-1
+            alpha = np.zeros_like(x)
+            delta_x = x[..., :-1] - x[..., 1:] - l[..., :-1]
+            delta_v = v[..., 1:] - v[..., :-1]
+            alpha[..., 1:] = (
+                s0[..., 1:] + np.maximum(0, T[..., 1:]*v[..., 1:] + delta_v*v[..., 1:]/sqrt_ab[..., 1:])
+            ) / delta_x
+
+            a[...] = a_max * (1-(v/v_max)**4 - alpha**2)
+            a[...] = np.where(stopped, -b_max*v/v_max, a)
+
+        # Check for traffic signals
+        v_max[...] = np.where(green[..., None], arrays['_v_max'], v_max)
+        stopped[..., 0] &= ~green
+
+        red = ~green & (self.count > 0)
+        head_x = x[..., 0]
+        slow = red & (head_x >= self.lengths - self.slow_distances)
+        v_max[..., 0] = np.where(slow, self.slow_factors * arrays['_v_max'][..., 0], v_max[..., 0])
+        stop = red & (head_x >= self.lengths - self.stop_distances) & (head_x <= self.lengths - self.stop_distances / 2)
+        stopped[..., 0] |= stop
+
+    def _update_generators(self):
+        for g, gen in enumerate(self.generators):
+            due = np.flatnonzero(self.t - self.gen_last_added[g] >= 60 / gen["vehicle_rate"])
+            for b in due:
+                values, path = gen["templates"][self.gen_upcoming[g, b]]
+                r = self.path_table[path, 0]
+                k = self.count[b, r]
+                if k == 0 or self.arrays['x'][b, r, k-1] > values['s0'] + values['l']:
+                    # If there is space for the generated vehicle; add it
+                    self._append(b, r, dict(values, path=path, path_pos=0))
+                    self.gen_last_added[g, b] = self.t[b]
+                self.gen_upcoming[g, b] = self._draw(self.gen_rngs[g][b], gen["weights"])
+
+    def _hand_off(self):
+        n = self.count.max()
+        if n == 0:
+            return
+        x = self.arrays['x'][..., :n]
+        valid = np.arange(n) < self.count[..., None]
+        past_end = valid & (x >= self.lengths[:, None])
+
+        # Vehicles past the end are a prefix of their road
+        exits = np.argmin(np.concatenate([past_end, np.zeros(past_end.shape[:2] + (1,), dtype=bool)], axis=2), axis=2)
+        bs, rs = np.nonzero(exits)
+        if len(bs) == 0:
+            return
+
+        # Take the leaving vehicles out and shift the rest to the head of their road
+        leaving = []
+        for b, r in zip(bs, rs):
+            for k in range(exits[b, r]):
+                leaving.append((b, r, {name: arr[b, r, k] for name, arr in self.arrays.items()}))
+        K = self.lane_capacity
+        shift = exits[bs, rs]
+        src = np.minimum(np.arange(K) + shift[:, None], K - 1)
+        for arr in self.arrays.values():
+            arr[bs, rs] = arr[bs[:, None], rs[:, None], src]
+        self.count[bs, rs] -= shift
+
+        # Move every vehicle with a next road to its tail, in order of road
+        for b, r, values in sorted(leaving, key=lambda item: (item[0], item[1])):
+            pos = values['path_pos'] + 1
+            if pos >= self.path_lengths[values['path']]:
+                continue
+            next_r = self.path_table[values['path'], pos]
+            x = values['x'] - self.lengths[r]
+            k = self.count[b, next_r]
+            if k > 0:
+                # Never overtake the last vehicle of the next road
+                x = min(x, self.arrays['x'][b, next_r, k-1])
+            values['x'] = x
+            values['path_pos'] = pos
+            self._append(b, next_r, values)
+
+    def _check_collisions(self):
+        n = self.count.max()
+        if n == 0:
+            return
+        valid = np.arange(n) < self.count[..., None]
+        bs, rs, ks = np.nonzero(valid)
+        xs = self.arrays['x'][bs, rs, ks]
+
+        inside = self.network.conflict_index(self.collision_detector.distance).contains(rs, xs)
+        bs, rs, xs = bs[inside], rs[inside], xs[inside]
+        if len(bs) < 2:
+            return
+
+        positions = self.network.world_positions(rs, xs)
+        positions[:, 0] += bs * self.replica_stride
+        i, j = self.collision_detector.candidate_pairs(positions)
+
+        # Vehicles on the same road never collide
+        keys = bs * len(self.network) + rs
+        i, j = i[keys[i] != keys[j]], j[keys[i] != keys[j]]
+        close = ((positions[i] - positions[j])**2).sum(axis=1) < self.collision_detector.distance**2
+        np.add.at(self.collisions, bs[i[close]], 1)
+
+    def update(self, green=None):
+        """Advances every replica by one frame"""
+        if green is None:
+            green = self.green()
+        self._update_vehicles(green)
+        self._update_generators()
+        self._hand_off()
+        self._check_collisions()
+        self.t += self.dt
+
+    def rewards(self):
+        """Average speed on the signal roads of every replica, -100 after a collision"""
+        n = self.count.max()
+        valid = np.arange(n) < self.count[..., None]
+        speeds = np.where(valid, self.arrays['v'][..., :n], 0).sum(axis=2)
+        on_signals = self.signal_road_mask
+        avg_speed = speeds[:, on_signals].sum(axis=1) / (1 + self.count[:, on_signals].sum(axis=1))
+        return np.where(self.collisions > 0, -100.0, avg_speed)
+
+    def observations(self):
+        """Returns a (replicas x (roads*sections + signals)) array.
+
+        The vehicles on every section of every road, then the signal phases."""
+        B, R = self.count.shape
+        n = self.count.max()
+        sections = np.zeros((B, R, self.n_sections))
+        if n > 0:
+            bs, rs, ks = np.nonzero(np.arange(n) < self.count[..., None])
+            section = np.clip(self.arrays['x'][bs, rs, ks] // self.section_length, 0, self.n_sections - 1)
+            np.add.at(sections, (bs, rs, section.astype(int)), 1)
+        return np.concatenate([sections.reshape(B, -1), self.phases], axis=1)
+
+    def step(self, actions):
+        """Sets the phase of every (replica, signal) and runs one decision interval.
+
+        Returns the observations, rewards and done flags of every replica.
+        Replicas whose episode ended are reset, their observation is the first
+        one of the new episode."""
+        if self.arrays is None:
+            self.reset()
+        self.phases[...] = np.asarray(actions, dtype=int).reshape(self.phases.shape)
+
+        green = self.green()
+        for _ in range(int(round(self.decision_interval / self.dt))):
+            self.update(green)
+
+        rewards = self.rewards()
+        dones = (self.t >= self.episode_length - self.dt / 2) | (self.collisions > self.max_collisions)
+        if dones.any():
+            self.episodes += dones
+            self.reset(np.flatnonzero(dones))
+        return self.observations(), rewards, dones
@@ -0,0 +1,251 @@
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+__all__ = [
+    'CollisionDetector', 'BruteForceDetector', 'SpatialHashDetector', 'COLLISION_DETECTORS', 'ConflictIndex'
+]
+
+
+class CollisionDetector(ABC):
+    """Counts vehicles on different roads closer than *distance* to each other"""
+    def __init__(self, config={}):
+        # Set default configuration
+        self.set_default_config()
+
+        # Update configuration
+        for attr, val in config.items():
+            setattr(self, attr, val)
+
+        self.metrics = {"pairs_checked": 0, "collisions": 0}
+
+    def set_default_config(self):
+        self.distance = 2
+
+    @abstractmethod
+    def candidate_pairs(self, positions):
+        """Returns two index arrays of the pairs that might collide"""
+
+    def detect(self, positions, road_ids):
+        """Returns the number of colliding pairs among *positions* (an (n, 2) array)"""
+        i, j = self.candidate_pairs(positions)
+
+        # Vehicles on the same road never collide
+        different_road = road_ids[i] != road_ids[j]
+        i, j = i[different_road], j[different_road]
+
+        delta = positions[i] - positions[j]
+        collisions = int(np.count_nonzero(
+            (delta**2).sum(axis=1) < self.distance**2
+        ))
+
+        self.metrics = {"pairs_checked": len(i), "collisions": collisions}
+        return collisions
+
+
+class BruteForceDetector(CollisionDetector):
+    """Checks every pair of vehicles"""
+    def candidate_pairs(self, positions):
+        return np.triu_indices(len(positions), 1)
+
+
+class SpatialHashDetector(CollisionDetector):
+    """Only checks vehicles in the same or neighbouring cells of a uniform grid"""
+    # Half of the 3x3 neighbourhood, so that every pair of cells is visited once
+    NEIGHBOURS = ((0, 0), (1, -1), (1, 0), (1, 1), (0, 1))
+
+    def set_default_config(self):
+        super().set_default_config()
+        self.cell_size = None   # Defaults to the collision distance
+        self.brute_force_below = 64   # Hashing costs more than it saves on few vehicles
+
+    def candidate_pairs(self, positions):
+        n = len(positions)
+        if n < max(self.brute_force_below, 2):
+            return np.triu_indices(n, 1)
+
+        cell_size = self.cell_size or self.distance
+        cells = np.floor(positions / cell_size).astype(np.int64)
+        cells -= cells.min(axis=0) - 1
+        width = cells[:, 1].max() + 2
+
+        # Sort vehicles by cell so that every cell is a contiguous range
+        keys = cells[:, 0] * width + cells[:, 1]
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+
+        firsts = []
+        seconds = []
+        for dx, dy in self.NEIGHBOURS:
+            neighbour_keys = keys + dx * width + dy
+            lo = np.searchsorted(sorted_keys, neighbour_keys, side='left')
+            hi = np.searchsorted(sorted_keys, neighbour_keys, side='right')
+            counts = hi - lo
+
+            first = np.repeat(np.arange(n), counts)
+            offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            second = order[np.repeat(lo, counts) + offsets]
+
+            if (dx, dy) == (0, 0):
+                # Count pairs inside a cell once and skip self pairs
+                keep = first < second
+                first, second = first[keep], second[keep]
+
+            firsts.append(first)
+            seconds.append(second)
+
+        return np.concatenate(firsts), np.concatenate(seconds)
+
+
+COLLISION_DETECTORS = {
+    "brute_force": BruteForceDetector,
+    "spatial_hash": SpatialHashDetector
+}
+
+
+def _capsule_range(p0, d, length, a, b, r):
+    """Returns the range of s in [0, length] for which p0 + s*d lies within r of segment ab"""
+    ranges = []
+
+    # Disks around both ends of the segment
+    for c in (a, b):
+        w = p0 - c
+        half_b = w @ d
+        disc = half_b**2 - (w @ w - r*r)
+        if disc > 0:
+            ranges.append((-half_b - np.sqrt(disc), -half_b + np.sqrt(disc)))
+
+    # Rectangle along the segment
+    ab_length = np.linalg.norm(b - a)
+    if ab_length > 0:
+        u = (b - a) / ab_length
+        n = np.array([-u[1], u[0]])
+        lo, hi = -np.inf, np.inf
+        for axis, lower, upper in ((u, 0, ab_length), (n, -r, r)):
+            k0, k1 = (p0 - a) @ axis, d @ axis
+            if abs(k1) < 1e-12:
+                if not lower <= k0 <= upper:
+                    lo, hi = np.inf, -np.inf
+                continue
+            s1, s2 = (lower - k0) / k1, (upper - k0) / k1
+            lo, hi = max(lo, min(s1, s2)), min(hi, max(s1, s2))
+        if lo < hi:
+            ranges.append((lo, hi))
+
+    if not ranges:
+        return None
+
+    # The capsule is convex, so the union of the pieces is one range
+    lo = max(0, min(lo for lo, _ in ranges))
+    hi = min(length, max(hi for _, hi in ranges))
+    if lo > hi:
+        return None
+    return lo, hi
+
+
+def _coarse_polyline(road, resolution):
+    """Returns at most *resolution* segments approximating the road.
+
+    Each segment is (start, end, arc length at start, arc length at end), the
+    second value returned is how far the road strays from the segments."""
+    points, arc_lengths = road.points, road.arc_lengths
+    vertices = np.unique(np.linspace(0, len(points) - 1, min(resolution, len(points) - 1) + 1).round().astype(int))
+
+    segments = []
+    error = 0
+    for k0, k1 in zip(vertices[:-1], vertices[1:]):
+        a, b = points[k0], points[k1]
+        segments.append((a, b, arc_lengths[k0], arc_lengths[k1]))
+        if k1 - k0 > 1:
+            # Distance of the skipped points to the chord
+            chord = b - a
+            t = np.clip((points[k0:k1] - a) @ chord / (chord @ chord), 0, 1)
+            error = max(error, np.linalg.norm(points[k0:k1] - (a + t[:, None] * chord), axis=1).max())
+
+    return segments, error
+
+
+class ConflictIndex:
+    """Arc-length ranges in which a road comes within *distance* of another road"""
+    def __init__(self, roads, distance=2, resolution=8):
+        self.distance = distance
+        self.resolution = resolution    # Segments per curved road
+        self.build(roads)
+
+    def build(self, roads):
+        r = self.distance + 1e-6
+        polylines = [_coarse_polyline(road, self.resolution) for road in roads]
+        lengths = np.array([road.length for road in roads], dtype=float)
+
+        # Broad phase on the bounding boxes of the roads
+        margins = np.array([error for _, error in polylines]).reshape(-1, 1)
+        lower = np.array([road.points.min(axis=0) for road in roads]).reshape(-1, 2) - r - margins
+        upper = np.array([road.points.max(axis=0) for road in roads]).reshape(-1, 2) + r + margins
+        overlap = np.all(
+            (lower[:, None] <= upper[None, :]) & (lower[None, :] <= upper[:, None]),
+            axis=2
+        )
+        candidates = np.argwhere(np.triu(overlap, 1))
+
+        def close_ranges(i, j):
+            # Ranges on road i within reach of road j
+            segments_i, error_i = polylines[i]
+            segments_j, error_j = polylines[j]
+            reach = r + error_i + error_j
+            found = []
+            for a, b, s0, s1 in segments_i:
+                chord = np.linalg.norm(b - a)
+                if chord == 0:
+                    continue
+                for c, d, _, _ in segments_j:
+                    found_range = _capsule_range(a, (b - a) / chord, chord, c, d, reach)
+                    if found_range is None:
+                        continue
+                    # Map the range on the chord back to the arc length of the road
+                    scale = (s1 - s0) / chord
+                    slack = (s1 - s0) - chord + error_i
+                    found.append((
+                        max(s0, s0 + found_range[0] * scale - slack),
+                        min(s1, s0 + found_range[1] * scale + slack)
+                    ))
+            return found
+
+        # Narrow phase: range on each road close to the other one
+        self.pairs = set()
+        ranges = {}
+        for i, j in candidates:
+            i, j = int(i), int(j)
+            ranges_i = close_ranges(i, j)
+            ranges_j = close_ranges(j, i)
+            if not ranges_i or not ranges_j:
+                continue
+            self.pairs.add((i, j))
+            ranges.setdefault(i, []).extend(ranges_i)
+            ranges.setdefault(j, []).extend(ranges_j)
+
+        # Merge overlapping ranges of every road
+        self.ranges = {}
+        for road_id, road_ranges in ranges.items():
+            merged = []
+            for lo, hi in sorted(road_ranges):
+                if merged and lo <= merged[-1][1]:
+                    merged[-1][1] = max(merged[-1][1], hi)
+                else:
+                    merged.append([lo, hi])
+            self.ranges[road_id] = [tuple(pair) for pair in merged]
+
+        # Flat sorted keys of the form road_id*span + s, used by contains
+        self.span = (lengths.max() if len(lengths) else 0) + 1
+        flat = [(road_id, lo, hi) for road_id in sorted(self.ranges) for lo, hi in self.ranges[road_id]]
+        flat = np.array(flat, dtype=float).reshape(-1, 3)
+        self.lo_keys = flat[:, 0] * self.span + flat[:, 1]
+        self.hi_keys = flat[:, 0] * self.span + flat[:, 2]
+
+    def contains(self, road_ids, xs):
+        """Returns a mask of the vehicles inside a conflict range of their road"""
+        if len(self.lo_keys) == 0:
+            return np.zeros(len(road_ids), dtype=bool)
+
+        keys = road_ids * self.span + np.clip(xs, 0, self.span - 1)
+        k = np.searchsorted(self.lo_keys, keys, side='right') - 1
+        return (k >= 0) & (keys <= self.hi_keys[np.maximum(k, 0)])
@@ -14,13 +14,17 @@ def curve_points(start, end, control, resolution=5):
 
 	return path
 
-def curve_road(start, end, control, resolution=15):
+def curve_road(start, end, control, resolution=15, curved=False):
+	# A single curved road instead of *resolution* straight ones
+	if curved:
+		return [(start, end, control)]
+
 	points = curve_points(start, end, control, resolution=resolution)
 	return [(points[i-1], points[i]) for i in range(1, len(points))]
 
 TURN_LEFT = 0
 TURN_RIGHT = 1
-def turn_road(start, end, turn_direction, resolution=15):
+def turn_road(start, end, turn_direction, resolution=15, curved=False):
 	# Get control point
 	x = min(start[0], end[0])
 	y = min(start[1], end[1])
@@ -36,5 +40,5 @@ def turn_road(start, end, turn_direction, resolution=15):
 			y - x + start[0]
 		)
 	
-	return curve_road(start, end, control, resolution=resolution)
+	return curve_road(start, end, control, resolution=resolution, curved=curved)
 
@@ -0,0 +1,160 @@
+import numpy as np
+
+from .vehicle import Vehicle
+
+# Vehicle attributes stored in the engine arrays
+FIELDS = ('x', 'v', 'a', 'l', 's0', 'T', 'v_max', 'a_max', 'b_max', 'sqrt_ab', '_v_max', 'stopped')
+
+
+def _array_field(name):
+    def fget(self):
+        return self.engine.arrays[name][self.slot]
+
+    def fset(self, val):
+        self.engine.arrays[name][self.slot] = val
+
+    return property(fget, fset)
+
+
+class VehicleView(Vehicle):
+    """A Vehicle whose IDM state is a slot in the arrays of a VectorizedEngine"""
+
+
+for _name in FIELDS:
+    setattr(VehicleView, _name, _array_field(_name))
+
+
+class VectorizedEngine:
+    def __init__(self, config={}):
+        # Set default configuration
+        self.set_default_config()
+
+        # Update configuration
+        for attr, val in config.items():
+            setattr(self, attr, val)
+
+        # Calculate properties
+        self.init_properties()
+
+    def set_default_config(self):
+        self.capacity = 256
+
+    def init_properties(self):
+        self.arrays = {
+            name: np.zeros(self.capacity, dtype=bool if name == 'stopped' else float)
+            for name in FIELDS
+        }
+        self.free_slots = list(range(self.capacity-1, -1, -1))
+
+    def grow(self):
+        """Doubles the capacity of every array"""
+        old_capacity = self.capacity
+        self.capacity *= 2
+        for name, arr in self.arrays.items():
+            new_arr = np.zeros(self.capacity, dtype=arr.dtype)
+            new_arr[:old_capacity] = arr
+            self.arrays[name] = new_arr
+        self.free_slots.extend(range(self.capacity-1, old_capacity-1, -1))
+
+    def bind(self, vehicle):
+        """Moves the state of *vehicle* into the arrays and turns it into a view"""
+        if isinstance(vehicle, VehicleView):
+            return
+        if not self.free_slots:
+            self.grow()
+
+        values = [getattr(vehicle, name) for name in FIELDS]
+        vehicle.__class__ = VehicleView
+        vehicle.engine = self
+        vehicle.slot = self.free_slots.pop()
+        for name, val in zip(FIELDS, values):
+            self.arrays[name][vehicle.slot] = val
+
+    def release(self, vehicle):
+        """Copies the state of *vehicle* back into the object and frees its slot"""
+        values = {name: self.arrays[name][vehicle.slot].item() for name in FIELDS}
+        self.free_slots.append(vehicle.slot)
+        vehicle.__class__ = Vehicle
+        del vehicle.engine, vehicle.slot
+        vehicle.__dict__.update(values)
+
+    def reset(self):
+        self.init_properties()
+
+    def update(self, roads, dt):
+        """Advances every vehicle on *roads* with one batched IDM step"""
+        occupied = []
+        for road in roads:
+            if len(road.vehicles) == 0:
+                road.speed_sum = 0
+                road.metrics['avg_speed'] = 0
+                continue
+            occupied.append(road)
+
+        if not occupied:
+            return
+
+        # Gather every road's vehicles into one contiguous block, leader first.
+        # The lanes keep the slots of their vehicles, one slice per road
+        idx = np.concatenate([road.vehicles.slots() for road in occupied])
+        counts = np.array([len(road.vehicles) for road in occupied])
+        starts = np.cumsum(counts) - counts
+
+        arrays = self.arrays
+        x, v, a = arrays['x'][idx], arrays['v'][idx], arrays['a'][idx]
+        l, s0, T = arrays['l'][idx], arrays['s0'][idx], arrays['T'][idx]
+        v_max, a_max, b_max = arrays['v_max'][idx], arrays['a_max'][idx], arrays['b_max'][idx]
+        sqrt_ab, stopped = arrays['sqrt_ab'][idx], arrays['stopped'][idx]
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # Update position and velocity
+            clamp = v + a*dt < 0
+            new_v = np.where(clamp, 0, v + a*dt)
+            x = np.where(clamp, x - 1/2*v*v/a, x + new_v*dt + a*dt*dt/2)
+            v = new_v
+
+            # Update acceleration, the first vehicle of a road has no lead
+            has_lead = np.ones(len(idx), dtype=bool)
+            has_lead[starts] = False
+            lead = np.arange(len(idx)) - 1
+
+            delta_x = x[lead] - x - l[lead]
+            delta_v = v - v[lead]
+            alpha = np.where(
+                has_lead,
+                (s0 + np.maximum(0, T*v + delta_v*v/sqrt_ab)) / delta_x,
+                0
+            )
+
+            a = a_max * (1-(v/v_max)**4 - alpha**2)
+            a = np.where(stopped, -b_max*v/v_max, a)
+
+        arrays['x'][idx] = x
+        arrays['v'][idx] = v
+        arrays['a'][idx] = a
+
+        # Check for traffic signals
+        green = np.array([road.traffic_signal_state for road in occupied], dtype=bool)
+        unslowed = idx[np.repeat(green, counts)]
+        arrays['v_max'][unslowed] = arrays['_v_max'][unslowed]
+        arrays['stopped'][idx[starts[green]]] = False
+
+        for road, start in zip(occupied, starts):
+            if road.traffic_signal_state:
+                continue
+            # If traffic signal is red
+            head = idx[start]
+            signal = road.traffic_signal
+            if arrays['x'][head] >= road.length - signal.slow_distance:
+                # Slow vehicles in slowing zone
+                arrays['v_max'][head] = signal.slow_factor*arrays['_v_max'][head]
+            if arrays['x'][head] >= road.length - signal.stop_distance and\
+               arrays['x'][head] <= road.length - signal.stop_distance / 2:
+                # Stop vehicles in the stop zone
+                arrays['stopped'][head] = True
+
+        # Update road metrics
+        speed_sums = np.add.reduceat(v, starts)
+        for road, speed_sum, count in zip(occupied, speed_sums, counts):
+            road.speed_sum = speed_sum
+            road.metrics['avg_speed'] = speed_sum / count
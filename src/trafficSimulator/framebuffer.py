@@ -0,0 +1,149 @@
+from multiprocessing import shared_memory
+from time import perf_counter, sleep
+
+import numpy as np
+
+from .snapshot import Snapshot, interpolate_published
+
+__all__ = ['SnapshotBuffer']
+
+HEADER = np.dtype([('capacity', '<i8'), ('signal_capacity', '<i8'), ('latest', '<i8')])
+
+
+def slot_dtype(capacity, signal_capacity):
+    return np.dtype([
+        ('sequence', '<i8'),    # Odd while the slot is written
+        ('t', '<f8'),
+        ('frame_count', '<i8'),
+        ('avg_speed', '<f8'),
+        ('vehicles', '<i8'),
+        ('signals', '<i8'),
+        ('ids', '<i8', (capacity,)),
+        ('road_ids', '<i4', (capacity,)),
+        ('xs', '<f8', (capacity,)),
+        ('lengths', '<f8', (capacity,)),
+        ('signal_states', '?', (signal_capacity,))
+    ])
+
+
+class SnapshotBuffer:
+    """Double buffered snapshots in shared memory, written by one process and read by others.
+
+    The writer fills the slot that is not the latest and then flips the latest
+    index, so publishing costs one copy of the snapshot and never waits for a
+    reader. Readers copy the latest slot and retry if its sequence number
+    changed meanwhile, up to *retries* times before they fall back to the last
+    snapshot they read. Snapshots with more than *capacity* vehicles or
+    *signal_capacity* signal groups are cut short.
+
+    Another process attaches with SnapshotBuffer(name=buffer.name)."""
+    def __init__(self, capacity=4096, signal_capacity=256, name=None, retries=8):
+        if name is None:
+            size = HEADER.itemsize + 2 * slot_dtype(capacity, signal_capacity).itemsize
+            self.memory = shared_memory.SharedMemory(create=True, size=size)
+            self.init_arrays(capacity, signal_capacity)
+            self.header['capacity'] = capacity
+            self.header['signal_capacity'] = signal_capacity
+            self.slots['sequence'] = 0
+            self.header['latest'] = -1
+        else:
+            self.memory = shared_memory.SharedMemory(name=name)
+            header = np.ndarray((), dtype=HEADER, buffer=self.memory.buf)
+            self.init_arrays(int(header['capacity']), int(header['signal_capacity']))
+
+        # Reader side, the last two snapshots read, stamped with when they were first seen
+        self.retries = retries
+        self.last_read = (None, -1)
+        self.previous = None
+        self.latest = None
+        self.latest_version = None
+        self.road_lengths = None    # Lengths of the roads to interpolate along, None shows the latest
+
+    @property
+    def name(self):
+        return self.memory.name
+
+    def init_arrays(self, capacity, signal_capacity):
+        self.header = np.ndarray((), dtype=HEADER, buffer=self.memory.buf)
+        self.slots = np.ndarray(
+            (2,), dtype=slot_dtype(capacity, signal_capacity),
+            buffer=self.memory.buf, offset=HEADER.itemsize
+        )
+
+    def __getstate__(self):
+        return {'name': self.memory.name, 'retries': self.retries}
+
+    def __setstate__(self, state):
+        self.__init__(name=state['name'], retries=state['retries'])
+
+    def publish(self, snapshot):
+        """Writes *snapshot* into the free slot and makes it the latest"""
+        i = 1 - max(int(self.header['latest']), 0)
+        slot = self.slots[i]
+        n = min(len(snapshot), len(slot['ids']))
+        signals = min(len(snapshot.signals), len(slot['signal_states']))
+
+        slot['sequence'] += 1
+        slot['t'] = snapshot.t
+        slot['frame_count'] = snapshot.frame_count
+        slot['avg_speed'] = snapshot.avg_speed
+        slot['vehicles'] = n
+        slot['signals'] = signals
+        slot['ids'][:n] = snapshot.ids[:n]
+        slot['road_ids'][:n] = snapshot.road_ids[:n]
+        slot['xs'][:n] = snapshot.xs[:n]
+        slot['lengths'][:n] = snapshot.lengths[:n]
+        slot['signal_states'][:signals] = snapshot.signals[:signals]
+        slot['sequence'] += 1
+
+        self.header['latest'] = i
+
+    def read(self):
+        """Returns a copy of the latest snapshot and its sequence number, (None, -1) before the first.
+
+        A slot that stays written, e.g. by a writer that died, gives the last
+        snapshot read instead."""
+        for attempt in range(self.retries):
+            if attempt:
+                # Back off from 20 us up to 1 ms
+                sleep(min(1e-5 * 2**attempt, 1e-3))
+            i = int(self.header['latest'])
+            if i < 0:
+                return None, -1
+            slot = self.slots[i]
+            sequence = int(slot['sequence'])
+            if sequence % 2:
+                continue
+
+            n, signals = int(slot['vehicles']), int(slot['signals'])
+            snapshot = Snapshot(
+                float(slot['t']), int(slot['frame_count']), float(slot['avg_speed']),
+                slot['ids'][:n].copy(), slot['road_ids'][:n].astype(int),
+                slot['xs'][:n].copy(), slot['lengths'][:n].copy(),
+                slot['signal_states'][:signals].copy()
+            )
+            # Written again while it was copied
+            if int(slot['sequence']) == sequence:
+                self.last_read = (snapshot, (i, sequence))
+                return self.last_read
+        return self.last_read
+
+    def snapshot(self, now=None):
+        """Returns the state to show, interpolated between the last two snapshots read"""
+        now = perf_counter() if now is None else now
+        snapshot, version = self.read()
+        if snapshot is None:
+            return None
+        if self.latest is None or version != self.latest_version:
+            # Stamped with the time this reader saw it, clocks of other processes may differ
+            snapshot.published = now
+            self.previous, self.latest, self.latest_version = self.latest, snapshot, version
+        if self.road_lengths is None:
+            return self.latest
+        return interpolate_published(self.previous, self.latest, now, self.road_lengths)
+
+    def close(self):
+        self.memory.close()
+
+    def unlink(self):
+        self.memory.unlink()
@@ -0,0 +1,74 @@
+import numpy as np
+
+
+class Lane:
+    """Ring buffer of the vehicles on a road, ordered from head to tail.
+
+    The engine slots of the vehicles are kept in a parallel array, so that the
+    VectorizedEngine gathers a lane without a loop over its vehicles."""
+    def __init__(self, capacity=16):
+        self._buffer = [None] * capacity
+        self._slots = np.full(capacity, -1, dtype=np.intp)
+        self._head = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self._size
+        if not 0 <= i < self._size:
+            raise IndexError('lane index out of range')
+        return self._buffer[(self._head + i) % len(self._buffer)]
+
+    def __iter__(self):
+        capacity = len(self._buffer)
+        for i in range(self._size):
+            yield self._buffer[(self._head + i) % capacity]
+
+    def _grow(self):
+        capacity = len(self._buffer)
+        self._slots = np.concatenate([self.slots(), np.full(capacity, -1, dtype=np.intp)])
+        self._buffer = list(self) + [None] * capacity
+        self._head = 0
+
+    def slots(self):
+        """Returns the engine slots of the vehicles from head to tail, -1 for unbound vehicles"""
+        end = self._head + self._size
+        if end <= len(self._buffer):
+            return self._slots[self._head:end]
+        return np.concatenate([self._slots[self._head:], self._slots[:end - len(self._buffer)]])
+
+    def append(self, vehicle):
+        """Adds a vehicle at the tail of the lane"""
+        if self._size == len(self._buffer):
+            self._grow()
+        i = (self._head + self._size) % len(self._buffer)
+        self._buffer[i] = vehicle
+        self._slots[i] = getattr(vehicle, 'slot', -1)
+        self._size += 1
+
+    def popleft(self):
+        """Removes and returns the vehicle at the head of the lane"""
+        if self._size == 0:
+            raise IndexError('pop from an empty lane')
+        vehicle = self._buffer[self._head]
+        self._buffer[self._head] = None
+        self._slots[self._head] = -1
+        self._head = (self._head + 1) % len(self._buffer)
+        self._size -= 1
+        return vehicle
+
+    def pairs(self):
+        """Yields (leader, follower) pairs from head to tail, the head vehicle has no leader"""
+        lead = None
+        for vehicle in self:
+            yield lead, vehicle
+            lead = vehicle
+
+    def clear(self):
+        self._buffer = [None] * len(self._buffer)
+        self._slots[:] = -1
+        self._head = 0
+        self._size = 0
@@ -1,25 +1,6 @@
 import random
-import numpy as np
-import pickle
-from collections import defaultdict
 import time
-
-class DefaultDict:
-    def __init__(self, base, default):
-        self.base = base
-        self.default = default
-
-    def __setitem__(self, key, value):
-        self.base[key] = value
-
-    def __getitem__(self, key):
-        try:
-            return self.base[key]
-        except KeyError:
-            self.base[key] = self.default
-        
-        return self.base[key]
-
+from .qtable import DictQTable, ArrayQTable, SharedQTable, BufferedQTable
 
 class Agent:
     def __init__(self, env, signal, sarsa, config={}):
@@ -33,6 +14,8 @@ class Agent:
         for attr, val in config.items():
             setattr(self, attr, val)
 
+        self.random = random if self.seed is None else random.Random(self.seed)
+
         self.load_qtable()
         self.previous_action = None
         self.previous_state = None
@@ -45,6 +28,11 @@ class Agent:
     def set_default_config(self):
         self.multithreaded = False
         self.default_val = 0
+        self.q_table_backend = "dict"    # "dict" or "array"
+        self.merge_strategy = None      # Buffer updates and merge them, see qtable.MERGE_STRATEGIES
+        self.merge_every_episodes = 1
+        self.merge_every_seconds = None
+        self.seed = None    # Seed of an own random stream, None uses the random module
 
     def save_qtable(self):
         if self.multithreaded:
@@ -52,15 +40,30 @@ class Agent:
 
     def load_qtable(self):
         if self.multithreaded:
-            self.q_table = DefaultDict(self.env.shared[self.id], self.default_val)
+            shared = self.env.shared[self.id]
+            if isinstance(shared, SharedQTable):
+                self.q_table = shared
+            else:
+                self.q_table = DictQTable(shared, self.action_space, self.default_val)
+            if self.merge_strategy:
+                self.q_table = BufferedQTable(
+                    self.q_table, self.lock, self.merge_strategy,
+                    self.merge_every_episodes, self.merge_every_seconds
+                )
+                # Only merges need the lock
+                self.lock = None
+        elif self.q_table_backend == "array":
+            self.q_table = ArrayQTable(self.action_space, self.default_val)
+        else:
+            self.q_table = DictQTable({}, self.action_space, self.default_val)
 
 
     def _lock(self):
-        if self.multithreaded:
+        if self.multithreaded and self.lock:
             self.lock.acquire()
 
     def _unlock(self):
-        if self.multithreaded:
+        if self.multithreaded and self.lock:
             self.lock.release()
 
     @property
@@ -83,55 +86,64 @@ class Agent:
         return reward
     
     def act(self):
-        rdn = random.uniform(0, 1) 
+        state = self.env.state_key
+        rdn = self.random.uniform(0, 1) 
 
         if rdn < self.epsilon:
-            action = random.choice(self.action_space)
+            action = self.random.choice(self.action_space)
         else:
             self._lock()
-            vals = [self.q_table[str(self.env.state), a] for a in self.action_space]
-            action = np.argmax(vals) # Exploit learned values
+            action = self.q_table.argmax(state) # Exploit learned values
             self._unlock()
         
-        self.previous_state = str(self.env.state)
+        self.previous_state = state
 
         self.signal.current_cycle_index = action
     
     # At this point the environment already made the step
     
     def update(self):
+        state = self.env.state_key
+
         self._lock()
 
+        # The old value is read and written in one update, under the row lock of a SharedQTable
         if not self.using_sarsa:
             action = self.signal.current_cycle_index
-            old_value = self.q_table[str(self.previous_state), action]
-            vals = [self.q_table[str(self.env.state), a] for a in self.action_space]
-            next_max = np.max(vals)
-            new_value = (1 - self.alpha) * old_value + self.alpha * (self.reward + self.gamma * next_max)
+            next_max = self.q_table.max(state)
+            target = self.reward + self.gamma * next_max
             #self.previous_reward = self.reward
-            self.q_table[str(self.previous_state), action] = new_value
+            self.q_table.update(
+                (self.previous_state, action),
+                lambda old_value: (1 - self.alpha) * old_value + self.alpha * target
+            )
 
         else:
             # Do sarsa things
             action = self.signal.current_cycle_index
-            current_q = self.q_table[str(self.previous_state), action]
 
-            vals = [self.q_table[str(self.env.state), a] for a in self.action_space]
-            
-            next_action = np.argmax(vals)
+            next_action = self.q_table.argmax(state)
 
-            next_q = self.q_table[str(self.env.state), next_action]
+            next_q = self.q_table[state, next_action]
 
-            new_q = current_q + self.alpha * (self.reward + self.gamma * next_q - current_q)   # next_max becomes Q(S',A')
+            target = self.reward + self.gamma * next_q     # next_max becomes Q(S',A')
 
             #self.previous_reward = self.reward
             #action = new_action
 
-            self.q_table[str(self.previous_state), action] = new_q
+            self.q_table.update(
+                (self.previous_state, action),
+                lambda current_q: current_q + self.alpha * (target - current_q)
+            )
 
         self._unlock()
 
+        if isinstance(self.q_table, BufferedQTable):
+            self.q_table.tick()
+
     def reset(self):
+        if isinstance(self.q_table, BufferedQTable):
+            self.q_table.end_episode()
         self.signal.current_cycle_index = 0
         self.previous_state = None
         #self.previous_action = None
@@ -0,0 +1,228 @@
+import ast
+import os
+import pickle
+import numpy as np
+
+from .qtable import SharedQTable, fingerprint
+
+
+def _fsync_append(path, data):
+    with open(path, 'ab') as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+
+
+def _migrate_state(state):
+    """Returns the state key of a state saved as str([[(road, section), ...], [cycle index, ...]])"""
+    if not isinstance(state, str):
+        return state
+    try:
+        sections, cycles = ast.literal_eval(state)
+        return tuple(map(tuple, sections)), tuple(cycles)
+    except (ValueError, SyntaxError, TypeError):
+        return None
+
+
+class QTableCheckpoint:
+    """Incremental checkpoints of one Q-table in an append-only log.
+
+    The log at *path*.log is an array of fixed width records (state fingerprint,
+    Q-value of every action); the last record of a state wins. Every save only
+    appends the states that changed since the previous save. Dict tables also
+    append their new states to *path*.states so that they can be restored.
+    Once the log holds *compact_ratio* times more records than states it is
+    rewritten to a temporary file and renamed over the old one."""
+    def __init__(self, path, actions, default=0, compact_ratio=2):
+        self.path = path
+        self.log_path = f'{path}.log'
+        self.states_path = f'{path}.states'
+        self.actions = list(actions)
+        self.columns = {a: i for i, a in enumerate(self.actions)}
+        self.default = default
+        self.compact_ratio = compact_ratio
+        self.dtype = np.dtype([('key', '<u8'), ('values', '<f8', (len(self.actions),))])
+
+        # What the log holds, to find the changes of the next save
+        self.saved = {}         # Fingerprint -> Q-values
+        self.states = {}        # Fingerprint -> state, dict tables only
+        self.states_size = None # Bytes of whole records in the states file, None before it is read
+        self.records = 0
+        self.saved_keys = None  # Copies of the arrays of a SharedQTable
+        self.saved_table = None
+
+    def read(self):
+        """Returns the keys and values of the latest record of every state in the log"""
+        try:
+            size = os.path.getsize(self.log_path)
+        except FileNotFoundError:
+            return np.zeros(0, dtype=np.uint64), np.zeros((0, len(self.actions)))
+
+        # Drop a record torn by a crash, so that the next ones stay aligned
+        self.records = size // self.dtype.itemsize
+        if size % self.dtype.itemsize:
+            os.truncate(self.log_path, self.records * self.dtype.itemsize)
+        if self.records == 0:
+            return np.zeros(0, dtype=np.uint64), np.zeros((0, len(self.actions)))
+        log = np.memmap(self.log_path, dtype=self.dtype, mode='r', shape=(self.records,))
+
+        # Index of the last record of every key
+        keys, first_from_end = np.unique(log['key'][::-1], return_index=True)
+        last = self.records - 1 - first_from_end
+        return keys, np.array(log['values'][last])
+
+    def read_states(self):
+        """Returns the states of the states file, dropping a record torn by a crash"""
+        states = {}
+        self.states_size = 0
+        try:
+            with open(self.states_path, 'rb') as file:
+                while True:
+                    try:
+                        key, state = pickle.load(file)
+                    except EOFError:
+                        break
+                    except Exception:
+                        # A torn pickle can fail in many ways, the next saves append after the last whole one
+                        os.truncate(self.states_path, self.states_size)
+                        break
+                    states[key] = state
+                    self.states_size = file.tell()
+        except FileNotFoundError:
+            pass
+        return states
+
+    def restore_shared(self, table):
+        """Loads the checkpoint into a SharedQTable"""
+        keys, values = self.read()
+        if len(keys) == 0 and os.path.exists(f'{self.path}.npz'):
+            # Checkpoint written by SharedQTable.save
+            data = np.load(f'{self.path}.npz')
+            keys, values = data['keys'], data['values']
+        table.load_rows(keys, values)
+
+        self.saved = dict(zip(keys.tolist(), map(tuple, values)))
+        self.saved_keys = table.keys.copy()
+        self.saved_table = table.table.copy()
+
+    def restore_dict(self):
+        """Returns the checkpoint as a dict keyed by (state, action)"""
+        keys, values = self.read()
+        self.states = self.read_states()
+        if len(keys) == 0 and os.path.exists(f'{self.path}.pickle'):
+            # Checkpoint written by pickling the whole table, keyed by the str of the state
+            with open(f'{self.path}.pickle', 'rb') as file:
+                legacy = pickle.load(file)
+            q_table = {}
+            for (state, action), value in legacy.items():
+                state = _migrate_state(state)
+                if state is not None:
+                    q_table[state, action] = value
+            # Written to the log now, later saves only see the keys written after this
+            self._save_dict(q_table.items())
+            return q_table
+
+        q_table = {}
+        for key, row in zip(keys.tolist(), values):
+            if key not in self.states:
+                continue
+            self.saved[key] = tuple(row)
+            for action, value in zip(self.actions, row):
+                q_table[self.states[key], action] = value
+        return q_table
+
+    def save(self, table):
+        """Appends the states of *table* that changed since the last save.
+
+        A QTableDict, or a proxy of one, only sends the keys written since the
+        previous save, any other dict is compared in full."""
+        if isinstance(table, SharedQTable):
+            self._save_shared(table)
+        elif hasattr(table, 'pop_dirty'):
+            self._save_dict(table.pop_dirty())
+        else:
+            self._save_dict(table.items())
+
+        if self.records > self.compact_ratio * max(len(self.saved), 1):
+            self.compact()
+
+    def _save_shared(self, table):
+        keys = table.keys.copy()
+        values = table.table.copy()
+        if self.saved_keys is None:
+            changed = keys != 0
+        else:
+            changed = (keys != 0) & (
+                (keys != self.saved_keys) | np.any(values != self.saved_table, axis=1)
+            )
+        self.saved_keys, self.saved_table = keys, values
+
+        self._append(keys[changed], values[changed])
+
+    def _save_dict(self, items):
+        if self.states_size is None:
+            self.states = self.read_states()
+
+        # Actions that were not written keep their saved values
+        rows = {}
+        for (state, action), value in items:
+            if state not in rows:
+                rows[state] = list(self.saved.get(fingerprint(state), [self.default] * len(self.actions)))
+            rows[state][self.columns[action]] = value
+
+        new_states = []
+        keys = []
+        values = []
+        for state, row in rows.items():
+            key = fingerprint(state)
+            if key not in self.states:
+                self.states[key] = state
+                new_states.append((key, state))
+            if self.saved.get(key) != tuple(row):
+                keys.append(key)
+                values.append(row)
+
+        if new_states:
+            data = b''.join(pickle.dumps(pair) for pair in new_states)
+            _fsync_append(self.states_path, data)
+            self.states_size += len(data)
+        self._append(
+            np.array(keys, dtype=np.uint64),
+            np.array(values, dtype=float).reshape(-1, len(self.actions))
+        )
+
+    def _append(self, keys, values):
+        if len(keys) == 0:
+            return
+        records = np.empty(len(keys), dtype=self.dtype)
+        records['key'] = keys
+        records['values'] = values
+        _fsync_append(self.log_path, records.tobytes())
+
+        self.records += len(keys)
+        self.saved.update(zip(keys.tolist(), map(tuple, values)))
+
+    def compact(self):
+        """Rewrites the log with one record per state"""
+        keys = np.fromiter(self.saved.keys(), dtype=np.uint64, count=len(self.saved))
+        records = np.empty(len(keys), dtype=self.dtype)
+        records['key'] = keys
+        records['values'] = np.array(list(self.saved.values()), dtype=float).reshape(-1, len(self.actions))
+
+        self._replace(self.log_path, records.tobytes())
+        self.records = len(records)
+        if self.states:
+            data = b''.join(
+                pickle.dumps((key, self.states[key])) for key in self.saved if key in self.states
+            )
+            self._replace(self.states_path, data)
+            self.states_size = len(data)
+
+    @staticmethod
+    def _replace(path, data):
+        tmp = f'{path}.tmp'
+        with open(tmp, 'wb') as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp, path)
@@ -0,0 +1,422 @@
+from functools import lru_cache
+from multiprocessing import Lock, shared_memory
+from multiprocessing.managers import DictProxy, SyncManager
+import hashlib
+import time
+import warnings
+import numpy as np
+
+
+class DefaultDict:
+    def __init__(self, base, default):
+        self.base = base
+        self.default = default
+
+    def __setitem__(self, key, value):
+        self.base[key] = value
+
+    def __getitem__(self, key):
+        try:
+            return self.base[key]
+        except KeyError:
+            self.base[key] = self.default
+        
+        return self.base[key]
+
+
+class QTable:
+    """Greedy queries shared by the Q-table backends, built on values and batch_values"""
+    def values(self, state):
+        """Returns the Q-values of every action in *state*"""
+        raise NotImplementedError
+
+    def batch_values(self, states):
+        """Returns a (states x actions) array of Q-values"""
+        return np.array([self.values(state) for state in states]).reshape(-1, len(self.actions))
+
+    def argmax(self, state):
+        return self.actions[np.argmax(self.values(state))]
+
+    def max(self, state):
+        return np.max(self.values(state))
+
+    def update(self, key, function):
+        """Sets the value of *key* to function(value), atomically in the backends that lock"""
+        self[key] = function(self[key])
+
+    def batch_argmax(self, states):
+        return np.array(self.actions)[np.argmax(self.batch_values(states), axis=1)]
+
+    def batch_max(self, states):
+        return np.max(self.batch_values(states), axis=1)
+
+
+class DictQTable(DefaultDict, QTable):
+    """Q-values in a (possibly shared) dict keyed by (state, action)"""
+    def __init__(self, base, actions, default=0):
+        super().__init__(base, default)
+        self.actions = list(actions)
+
+    def values(self, state):
+        return np.array([self[state, a] for a in self.actions])
+
+
+class QTableDict(dict):
+    """dict that remembers the keys written since the last pop_dirty.
+
+    Kept in a QTableManager, so that checkpoints fetch the changed entries of a
+    shared table in one round trip instead of the whole table."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.dirty = set()
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.dirty.add(key)
+
+    def update(self, other=(), **kwargs):
+        other = dict(other, **kwargs)
+        super().update(other)
+        self.dirty.update(other)
+
+    def pop_dirty(self):
+        """Returns the (key, value) pairs written since the last call"""
+        dirty, self.dirty = self.dirty, set()
+        return [(key, self[key]) for key in dirty if key in self]
+
+
+class QTableDictProxy(DictProxy):
+    _exposed_ = DictProxy._exposed_ + ('pop_dirty',)
+
+    def pop_dirty(self):
+        return self._callmethod('pop_dirty')
+
+
+class QTableManager(SyncManager):
+    """SyncManager that also serves QTableDicts"""
+
+
+QTableManager.register('QTableDict', QTableDict, QTableDictProxy)
+
+
+class ArrayQTable(QTable):
+    """Q-values in a (states x actions) array, states are interned into row ids"""
+    def __init__(self, actions, default=0, capacity=1024):
+        self.actions = list(actions)
+        self.columns = {a: i for i, a in enumerate(self.actions)}
+        self.default = default
+        self.ids = {}
+        self.table = np.full((capacity, len(self.actions)), default, dtype=float)
+
+    def state_id(self, state):
+        """Returns the row of *state*, adding a row if it is new"""
+        try:
+            return self.ids[state]
+        except KeyError:
+            pass
+
+        i = len(self.ids)
+        if i == len(self.table):
+            # Double the number of rows
+            grown = np.full((2*len(self.table), len(self.actions)), self.default, dtype=float)
+            grown[:i] = self.table
+            self.table = grown
+        self.ids[state] = i
+        return i
+
+    def __getitem__(self, key):
+        state, action = key
+        i = self.ids.get(state)
+        if i is None:
+            return self.default
+        return self.table[i, self.columns[action]]
+
+    def __setitem__(self, key, value):
+        state, action = key
+        self.table[self.state_id(state), self.columns[action]] = value
+
+    def values(self, state):
+        i = self.ids.get(state)
+        if i is None:
+            return np.full(len(self.actions), self.default, dtype=float)
+        return self.table[i]
+
+    def batch_values(self, states):
+        rows = np.array([self.ids.get(state, -1) for state in states], dtype=int)
+        values = self.table[rows]
+        values[rows < 0] = self.default
+        return values
+
+    def to_dict(self):
+        """Returns the table as a dict keyed by (state, action)"""
+        return {
+            (state, a): self.table[i, j]
+            for state, i in self.ids.items() for a, j in self.columns.items()
+        }
+
+
+
+@lru_cache(maxsize=4096)
+def fingerprint(state):
+    """Returns a stable non-zero 64 bit id of *state*, the same in every process"""
+    digest = hashlib.blake2b(repr(state).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') or 1
+
+
+class SharedQTable(QTable):
+    """Q-values in shared memory, readable by every worker process without IPC.
+
+    States are interned by fingerprint into an open addressing table of fixed
+    *capacity*. Reads take no lock, new states are added under one lock and
+    values are written under one of *stripes* locks picked by row, which update
+    holds across its read and write. Once the table is full, updates of new
+    states are dropped with a warning."""
+    def __init__(self, actions, default=0, capacity=2**16, stripes=64):
+        self.actions = list(actions)
+        self.columns = {a: i for i, a in enumerate(self.actions)}
+        self.default = default
+        self.capacity = capacity
+
+        self.memory = shared_memory.SharedMemory(
+            create=True, size=capacity * 8 * (1 + len(self.actions))
+        )
+        self.init_arrays()
+        self.keys[:] = 0
+        self.table[:] = default
+
+        self.insert_lock = Lock()
+        self.locks = [Lock() for _ in range(stripes)]
+        self.full = False   # Warned that the table is full, per process
+
+    def init_arrays(self):
+        self.keys = np.ndarray((self.capacity,), dtype=np.uint64, buffer=self.memory.buf)
+        self.table = np.ndarray(
+            (self.capacity, len(self.actions)), dtype=float,
+            buffer=self.memory.buf, offset=self.capacity * 8
+        )
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['keys'], state['table']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.init_arrays()
+
+    def _probe(self, key):
+        """Returns the row of *key* or the empty row where it would go, None if the table is full"""
+        start = key % self.capacity
+        stored = self.keys[start]
+        if stored == key or stored == 0:
+            return start
+
+        # Longer probes are scanned with numpy, the next few rows and then the whole table
+        for length in (16, self.capacity):
+            end = start + length
+            for lo, hi in ((start, min(end, self.capacity)), (0, max(end - self.capacity, 0))):
+                keys = self.keys[lo:hi]
+                hits = np.flatnonzero((keys == key) | (keys == 0))
+                if len(hits):
+                    return lo + int(hits[0])
+        return None
+
+    def _warn_full(self):
+        if not self.full:
+            self.full = True
+            warnings.warn(
+                f'shared Q-table is full ({self.capacity} states), new states are not stored',
+                RuntimeWarning
+            )
+
+    def find(self, state):
+        """Returns the row of *state* or None if it was never written"""
+        key = fingerprint(state)
+        i = self._probe(key)
+        return i if i is not None and self.keys[i] == key else None
+
+    def state_id(self, state):
+        """Returns the row of *state*, adding a row if it is new, None if the table is full"""
+        key = fingerprint(state)
+        i = self._probe(key)
+        if i is not None and self.keys[i] == key:
+            return i
+        if self.full:
+            # Rows are never freed
+            return None
+
+        with self.insert_lock:
+            # Another worker may have added a state since the probe
+            i = self._probe(key)
+            if i is None:
+                self._warn_full()
+            elif self.keys[i] != key:
+                self.table[i] = self.default
+                self.keys[i] = key
+        return i
+
+    def __getitem__(self, key):
+        state, action = key
+        i = self.find(state)
+        if i is None:
+            return self.default
+        return self.table[i, self.columns[action]]
+
+    def __setitem__(self, key, value):
+        state, action = key
+        i = self.state_id(state)
+        if i is None:
+            return
+        with self.locks[i % len(self.locks)]:
+            self.table[i, self.columns[action]] = value
+
+    def update(self, key, function):
+        """Sets the value of *key* to function(value), holding the lock of its row throughout"""
+        state, action = key
+        i = self.state_id(state)
+        if i is None:
+            return
+        j = self.columns[action]
+        with self.locks[i % len(self.locks)]:
+            self.table[i, j] = function(self.table[i, j])
+
+    def values(self, state):
+        i = self.find(state)
+        if i is None:
+            return np.full(len(self.actions), self.default, dtype=float)
+        return self.table[i].copy()
+
+    def save(self, path):
+        """Writes the used rows to *path* as a .npz file"""
+        used = self.keys != 0
+        np.savez(path, keys=self.keys[used], values=self.table[used])
+
+    def load(self, path):
+        """Adds the rows of a file written by save, if it exists"""
+        try:
+            data = np.load(path)
+        except FileNotFoundError:
+            return
+        self.load_rows(data['keys'], data['values'])
+
+    def load_rows(self, keys, values):
+        """Sets the Q-values of the states with fingerprints *keys*"""
+        with self.insert_lock:
+            for key, row in zip(keys, values):
+                i = self._probe(int(key))
+                if i is None:
+                    self._warn_full()
+                    break
+                self.table[i] = row
+                self.keys[i] = key
+
+    def close(self):
+        self.memory.close()
+
+    def unlink(self):
+        self.memory.unlink()
+
+
+# How a buffered value is combined with the shared one: f(shared, local, base)
+# where base is the value the local update started from
+MERGE_STRATEGIES = {
+    "average": lambda shared, local, base: (shared + local) / 2,
+    "last_writer_wins": lambda shared, local, base: local,
+    "sum_of_deltas": lambda shared, local, base: shared + local - base
+}
+
+
+class BufferedQTable(QTable):
+    """Buffers the updates of one worker and merges them into a shared table.
+
+    Writes go to a local dict. Reads fall back to the shared table, which is
+    read once per key and merge interval, so IPC grows with the states a worker
+    visits and not with the size of the table. Merges happen every
+    *episodes* episodes and/or *seconds* seconds and are the only time *lock* is
+    taken, they only read and write the buffered keys."""
+    def __init__(self, shared, lock=None, strategy="sum_of_deltas", episodes=1, seconds=None):
+        self.shared = shared
+        self.actions = shared.actions
+        self.default = shared.default
+        self.lock = lock
+        self.combine = MERGE_STRATEGIES[strategy]
+        self.episodes = episodes
+        self.seconds = seconds
+
+        self.local = {}
+        self.base = {}
+        self.episode_count = 0
+        self.merged_at = time.time()
+        self.refresh()
+
+    def refresh(self, fresh={}):
+        """Forgets the values read from the shared table, except the *fresh* ones"""
+        self.read_cache = dict(fresh)
+
+    def read_shared(self, key):
+        try:
+            return self.read_cache[key]
+        except KeyError:
+            pass
+        if isinstance(self.shared, SharedQTable):
+            value = self.shared[key]
+        else:
+            # One round trip, without the lock and without adding the key
+            value = self.shared.base.get(key, self.default)
+        # Kept until the next merge, so that the base of a buffered value is the value it started from
+        self.read_cache[key] = value
+        return value
+
+    def __getitem__(self, key):
+        try:
+            return self.local[key]
+        except KeyError:
+            return self.read_shared(key)
+
+    def __setitem__(self, key, value):
+        if key not in self.base:
+            self.base[key] = self.read_shared(key)
+        self.local[key] = value
+
+    def values(self, state):
+        return np.array([self[state, a] for a in self.actions])
+
+    def merge(self):
+        """Combines the buffered values with the shared table and starts a new buffer"""
+        if self.lock:
+            self.lock.acquire()
+        try:
+            if isinstance(self.shared, SharedQTable):
+                # Without a lock, each value is combined under the lock of its row
+                for key, value in self.local.items():
+                    self.shared.update(
+                        key, lambda shared, value=value, base=self.base[key]: self.combine(shared, value, base)
+                    )
+            else:
+                # One round trip per buffered key to read it and one to write them all
+                merged = {
+                    key: self.combine(self.shared.base.get(key, self.default), value, self.base[key])
+                    for key, value in self.local.items()
+                }
+                self.shared.base.update(merged)
+        finally:
+            if self.lock:
+                self.lock.release()
+
+        self.local = {}
+        self.base = {}
+        self.merged_at = time.time()
+        self.refresh(merged if not isinstance(self.shared, SharedQTable) else {})
+
+    def tick(self):
+        """Merges if more than *seconds* passed since the last merge"""
+        if self.seconds is not None and time.time() - self.merged_at >= self.seconds:
+            self.merge()
+
+    def end_episode(self):
+        """Merges every *episodes* episodes"""
+        self.episode_count += 1
+        if self.episodes and self.episode_count % self.episodes == 0:
+            self.merge()
+        else:
+            self.tick()
@@ -0,0 +1,131 @@
+import os
+from threading import Lock
+import numpy as np
+from collections.abc import MutableMapping
+
+
+class Metrics(MutableMapping):
+    """Metrics of a simulation, read like a dict.
+
+    Counters are stored as they are set. Views are registered functions that
+    are only computed when read, and then reused for *period* frames."""
+    def __init__(self, sim, values={}):
+        self.sim = sim
+        self._values = dict(values)
+        self.views = {}
+        self.cache = {}
+
+    def register(self, name, function, period=1):
+        """Adds a view computed by *function* at most once every *period* frames"""
+        self.views[name] = [function, period]
+        self.cache.pop(name, None)
+
+    def set_period(self, name, period):
+        self.views[name][1] = period
+        self.cache.pop(name, None)
+
+    def invalidate(self):
+        """Forgets every cached view"""
+        self.cache = {}
+
+    def reset(self, values):
+        self._values = dict(values)
+        self.invalidate()
+
+    def __getitem__(self, name):
+        if name in self._values:
+            return self._values[name]
+
+        function, period = self.views[name]
+        frame = self.sim.frame_count
+        if name in self.cache:
+            cached_frame, value = self.cache[name]
+            if 0 <= frame - cached_frame < period:
+                return value
+
+        value = function()
+        self.cache[name] = (frame, value)
+        return value
+
+    def __setitem__(self, name, value):
+        self._values[name] = value
+
+    def __delitem__(self, name):
+        del self._values[name]
+
+    def __iter__(self):
+        yield from self._values
+        yield from self.views
+
+    def __len__(self):
+        return len(self._values) + len(self.views)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+# One episode summary in a metrics log
+METRICS_RECORD = np.dtype([
+    ('avg_speed', '<f8'),
+    ('collisions', '<i8'),
+    ('steps', '<f8'),
+    ('episodes', '<i8'),
+    ('worker', '<i4'),
+    ('wall_time', '<f8')
+])
+
+
+class MetricsLog:
+    """Append-only binary log of METRICS_RECORD records.
+
+    At most *buffer_size* records are kept in memory, they are written in one
+    chunk when the buffer is full or on flush. Safe to use from several threads."""
+    def __init__(self, path, buffer_size=256):
+        self.path = path
+        self.buffer_size = buffer_size
+        self.buffer = []
+        self.lock = Lock()
+
+        # Drop a record torn by a crash, so that the next ones stay aligned
+        try:
+            size = os.path.getsize(path)
+            if size % METRICS_RECORD.itemsize:
+                os.truncate(path, size - size % METRICS_RECORD.itemsize)
+        except FileNotFoundError:
+            pass
+
+    def append(self, metrics):
+        """Adds a dict with the fields of METRICS_RECORD, missing fields are 0"""
+        self.extend([metrics])
+
+    def extend(self, metrics_list):
+        with self.lock:
+            for metrics in metrics_list:
+                self.buffer.append(tuple(metrics.get(name, 0) for name in METRICS_RECORD.names))
+                if len(self.buffer) >= self.buffer_size:
+                    self._write()
+
+    def flush(self):
+        with self.lock:
+            self._write()
+
+    def _write(self):
+        if not self.buffer:
+            return
+        with open(self.path, 'ab') as file:
+            file.write(np.array(self.buffer, dtype=METRICS_RECORD).tobytes())
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+
+
+def read_metrics_log(path):
+    """Returns the records of a metrics log as a read only memory-mapped array"""
+    try:
+        count = os.path.getsize(path) // METRICS_RECORD.itemsize
+    except FileNotFoundError:
+        count = 0
+    if count == 0:
+        return np.zeros(0, dtype=METRICS_RECORD)
+    return np.memmap(path, dtype=METRICS_RECORD, mode='r', shape=(count,))
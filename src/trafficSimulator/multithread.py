@@ -1,114 +1,275 @@
-from multiprocessing import cpu_count, Process, Lock, Manager, Queue
+from multiprocessing import cpu_count, Lock, Queue, Pool, Event, Process
+from queue import Empty
+from threading import Thread
 
 from src.trafficSimulator.simulation import Simulation
+from src.trafficSimulator.metrics import MetricsLog
+from src.trafficSimulator.scenario import Scenario
+from src.trafficSimulator.learning.qtable import QTableManager, SharedQTable
+from src.trafficSimulator.learning.checkpoint import QTableCheckpoint
+from src.trafficSimulator.framebuffer import SnapshotBuffer
 
-import pickle
-import time
+import signal
+
+
+# Set in every pool worker by _init_worker
+_worker = {}
+
+
+def _init_worker(config, scenario, locks, stop):
+    # The parent handles Ctrl-C and tells the workers to stop through *stop*
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _worker.update(config=config, scenario=scenario, locks=locks, stop=stop)
+
+
+def _run_worker(args):
+    i, episodes, seconds = args
+    # Every worker builds its own simulation from the scenario, one of them publishes snapshots
+    config = dict(_worker["config"], id=i)
+    if i != config.pop("viewer_worker"):
+        config["snapshot_buffer"] = None
+    sim = Simulation(config)
+    _worker["scenario"].build(sim, _worker["locks"])
+    return sim.run_episodes(episodes, seconds, _worker["stop"])
+
+
+def run_viewer(scenario, buffer_name, config={}):
+    """Shows the snapshots of a SnapshotBuffer in a Window until it is closed"""
+    from src.trafficSimulator.window import Window
+
+    # Only the roads and signals of the scenario are drawn, this simulation never runs
+    sim = Simulation()
+    scenario.build(sim)
+    buffer = SnapshotBuffer(name=buffer_name)
+    buffer.road_lengths = sim.network.packed['lengths']
+    try:
+        Window(sim, dict(config, source=buffer)).loop()
+    finally:
+        buffer.close()
 
 
 class MultithreadSimulation:
     def __init__(self, config={}) -> None:
-        self.processes = []
-        self.manager = Manager()
-        self.shared = self.manager.list()
+        config = dict(config)
+        self.manager = QTableManager()
+        self.manager.start()
+        # "dict" keeps Q-tables in QTableDicts of the manager, "shared_memory" in SharedQTables
+        self.q_table_backend = config.get("q_table_backend", "dict")
+        if self.q_table_backend == "shared_memory":
+            self.shared = []
+        else:
+            self.shared = self.manager.list()
         self.shared_metrics = Queue()
-        self.simulations = []
-        self.current_metrics = []
+        self.metrics_log = MetricsLog(config.pop("metrics_path", "metrics.log"))
+        self.workers = config.pop("workers", None) or cpu_count()
+        self.save_interval = config.pop("save_interval", 20)   # Seconds between checkpoints
+        self.viewer_worker = config.pop("viewer_worker", None)  # Worker that publishes snapshots, None for none
+        self.snapshot_capacity = config.pop("snapshot_capacity", 4096)   # Most vehicles in a snapshot
+        self.snapshot_buffer = None
+        # Rows of every shared memory Q-table, None sizes them from the states they restore
+        self.q_table_capacity = config.pop("q_table_capacity", None)
+        self.stop_event = Event()
+        self.worker_stats = []
 
-        config.update({
-            "id": 0,
+        # Only the scenario and one lock per signal are sent to the workers
+        self.scenario = Scenario()
+        self.locks = []
+        self.checkpoints = []
+        self.config = dict(config, **{
             "multithreaded": True,
             "shared": self.shared,
             "manager": self.manager,
             "shared_metrics": self.shared_metrics
         })
 
-        #for i in range(cpu_count() - 4):
-        for i in range(20):
-            config["id"] = i
-            sim = Simulation(config)
-            self.simulations.append(sim)
-        
+        # Local copy of the first worker, shown by Window and stepped by run
+        self.simulation = Simulation(dict(self.config, id=0))
+
     @property
     def roads(self):
-        return self.simulations[0].roads
+        return self.simulation.roads
     
+    @property
+    def network(self):
+        return self.simulation.network
+
     @property
     def traffic_signals(self):
-        return self.simulations[0].traffic_signals
+        return self.simulation.traffic_signals
 
     @property
     def t(self):
-        return self.simulations[0].t
+        return self.simulation.t
     
     @property
     def frame_count(self):
-        return self.simulations[0].frame_count
+        return self.simulation.frame_count
     
     @property
     def metrics(self):
-        return self.simulations[0].metrics
+        return self.simulation.metrics
 
 
     def create_roads(self, road_list):
-        for sim in self.simulations:
-            sim.create_roads(road_list)
+        self.scenario.create_roads(road_list)
+        self.simulation.create_roads(road_list)
 
     def create_gen(self, config={}):
-        for sim in self.simulations:
-            sim.create_gen(config)
+        self.scenario.create_gen(config)
+        self.simulation.create_gen(config)
 
     def create_signal(self, roads, config={}):
-        lock = Lock()
-        self.shared.append((self.manager.dict(self.load_shared(len(self.shared)))))
-        for sim in self.simulations:
-            sim.create_signal(roads, lock, config)
+        checkpoint = QTableCheckpoint(f'qtable{len(self.shared)}', [0, 1])
+        if self.q_table_backend == "shared_memory":
+            # The table does its own fine grained locking
+            lock = None
+            table = SharedQTable([0, 1], capacity=self.shared_capacity(checkpoint))
+            checkpoint.restore_shared(table)
+            self.shared.append(table)
+        else:
+            lock = Lock()
+            self.shared.append(self.manager.QTableDict(checkpoint.restore_dict()))
+        self.checkpoints.append(checkpoint)
+        self.locks.append(lock)
+        self.scenario.create_signal(roads, config)
+        self.simulation.create_signal(roads, lock, config)
+
+    def shared_capacity(self, checkpoint):
+        """Rows of a new SharedQTable, a power of two with room to spare for *checkpoint*.
+
+        Open addressing slows down as the table fills, so a restored table starts
+        at most a quarter full."""
+        if self.q_table_capacity is not None:
+            return self.q_table_capacity
+        states = len(checkpoint.read()[0])
+        return max(2**16, 1 << (4 * states - 1).bit_length())
 
     def load_shared(self, id):
+        """Returns the checkpoint of Q-table *id* as a dict keyed by (state, action)"""
+        return QTableCheckpoint(f'qtable{id}', [0, 1]).restore_dict()
+
+    def save_qtables(self):
+        """Appends the Q-values changed since the last checkpoint to the logs"""
+        for checkpoint, table in zip(self.checkpoints, self.shared):
+            checkpoint.save(table)
+
+    def drain_metrics(self, timeout=0, batch_size=1024):
+        """Moves the queued episode metrics to the metrics log, in batches.
+
+        Waits up to *timeout* seconds for the first item."""
+        batch = []
         try:
-            with open(f'qtable{id}.pickle', 'rb') as file:
-                q_table = pickle.load(file)
-        except FileNotFoundError:
-            q_table = {}
-        
-        return q_table
-
-    def save_shared(self):
-        while True:
-            for id, s in enumerate(self.shared):
-                with open(f'qtable{id}.pickle', 'wb') as file:
-                    pickle.dump(dict(s), file)
-
-            time.sleep(20)
-
-    def save_metrics(self):
-        while True:            
-            item = self.shared_metrics.get(True)
-            self.current_metrics.append(item)
-            with open('metrics.pickle', 'wb') as file:
-                pickle.dump(self.current_metrics, file)
-            time.sleep(10)
-
-    def run(self, steps=1):       
-        self.simulations[0].run(steps)
+            batch.append(self.shared_metrics.get(timeout > 0, timeout or None))
+            while len(batch) < batch_size:
+                batch.append(self.shared_metrics.get_nowait())
+        except Empty:
+            pass
+        self.metrics_log.extend(batch)
+        return len(batch)
 
-    def run_forever(self):
-        for sim in self.simulations:
-            p = Process(target=sim.run_forever)
-            p.start()
-            self.processes.append(p)
+    def save_periodically(self):
+        while not self.stop_event.wait(self.save_interval):
+            self.save_qtables()
+            self.metrics_log.flush()
+
+    def drain_periodically(self):
+        while not self.stop_event.is_set():
+            self.drain_metrics(timeout=1)
 
-        p = Process(target=self.save_shared)
-        p.start()
-        self.processes.append(p)
+    def run(self, steps=1):
+        self.simulation.run(steps)
 
-        p = Process(target=self.save_metrics)
-        p.start()
-        self.processes.append(p)
+    def run_pool(self, episodes=None, seconds=None):
+        """Runs every simulation in a pool of worker processes.
+
+        Each worker stops after *episodes* episodes or *seconds* seconds, or when
+        interrupted. Q-tables and metrics are flushed before returning the
+        per-worker statistics, or before the exception of a failed worker is raised."""
+        self.stop_event.clear()
+        savers = [
+            Thread(target=self.save_periodically, daemon=True),
+            Thread(target=self.drain_periodically, daemon=True)
+        ]
+        for saver in savers:
+            saver.start()
+
+        # Every worker simulation is built on the same read only road network
+        network = self.simulation.network
+        if self.simulation.conflict_zones:
+            # Built once here and sent with the network, instead of once in every worker
+            network.conflict_index(self.simulation.collision_detector.distance)
+        network.freeze()
+        config = dict(self.config, network=network, viewer_worker=self.viewer_worker)
+        if self.viewer_worker is not None:
+            config["snapshot_buffer"] = self.create_snapshot_buffer()
+
+        jobs = [(i, episodes, seconds) for i in range(self.workers)]
+        pool = Pool(
+            self.workers, initializer=_init_worker,
+            initargs=(config, self.scenario, self.locks, self.stop_event)
+        )
+        self.worker_stats = []
+        results = pool.imap_unordered(_run_worker, jobs)
+        try:
+            while len(self.worker_stats) < len(jobs):
+                try:
+                    self.worker_stats.append(next(results))
+                except KeyboardInterrupt:
+                    # Let the workers finish their step and merge their Q-tables
+                    self.stop_event.set()
+        finally:
+            self.stop_event.set()
+            pool.close()
+            pool.join()
+            for saver in savers:
+                saver.join()
 
-        for p in self.processes:
-            p.join()
-        
+            # Whatever the workers learned before one of them failed is kept too
+            self.save_qtables()
+            while self.drain_metrics():
+                pass
+            self.metrics_log.flush()
+        return self.stats
 
+    def create_snapshot_buffer(self):
+        """Returns the SnapshotBuffer that the viewer worker publishes to, created once"""
+        if self.snapshot_buffer is None:
+            signal_groups = sum(len(groups) for groups in self.simulation.network.signals)
+            self.snapshot_buffer = SnapshotBuffer(self.snapshot_capacity, max(signal_groups, 1))
+        return self.snapshot_buffer
+
+    def open_viewer(self, config={}):
+        """Starts a Window in another process showing the viewer worker and returns the process.
+
+        Closing the window or killing the process never affects the workers, and
+        a viewer can be opened again at any time. Needs a viewer_worker in the config."""
+        if self.viewer_worker is None:
+            raise ValueError("open_viewer needs the viewer_worker config, no worker publishes snapshots")
+        viewer = Process(
+            target=run_viewer, args=(self.scenario, self.create_snapshot_buffer().name, config), daemon=True
+        )
+        viewer.start()
+        return viewer
+
+    @property
+    def stats(self):
+        """Episodes per second of every worker and of the whole pool"""
+        return {
+            "workers": sorted(self.worker_stats, key=lambda stats: stats["id"]),
+            "episodes": sum(stats["episodes"] for stats in self.worker_stats),
+            "episodes_per_second": sum(stats["episodes_per_second"] for stats in self.worker_stats)
+        }
+
+    def run_forever(self):
+        try:
+            return self.run_pool()
+        finally:
+            self.close()
 
-    
\ No newline at end of file
+    def close(self):
+        """Frees the shared memory of the Q-tables and of the snapshot buffer"""
+        for s in self.shared:
+            if isinstance(s, SharedQTable):
+                s.unlink()
+        if self.snapshot_buffer is not None:
+            self.snapshot_buffer.unlink()
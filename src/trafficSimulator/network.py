@@ -0,0 +1,159 @@
+import numpy as np
+from .curve import curve_points
+from .collision import ConflictIndex
+
+
+class RoadShape:
+    """Immutable geometry of one road, a lookup table from arc length to world position"""
+    __slots__ = ('start', 'end', 'control', 'length', 'angle_cos', 'angle_sin', 'points', 'arc_lengths', 'trig')
+
+    def __init__(self, start, end, control=None, resolution=50):
+        self.start = tuple(start)
+        self.end = tuple(end)
+        self.control = control
+
+        if control is None:
+            points = np.array([start, end], dtype=float)
+        else:
+            points = np.array(curve_points(start, end, control, resolution=resolution), dtype=float)
+        deltas = np.diff(points, axis=0)
+        lengths = np.hypot(deltas[:, 0], deltas[:, 1])
+
+        self.points = points
+        self.arc_lengths = np.concatenate([[0], np.cumsum(lengths)])
+        self.length = float(self.arc_lengths[-1])
+        self.trig = deltas / lengths[:, None]
+
+        # Direction at the end of the road, where traffic signals are
+        self.angle_cos, self.angle_sin = (float(c) for c in self.trig[-1])
+
+
+class RoadNetwork:
+    """Geometry and topology of a road network, shared by every Simulation built on it.
+
+    Roads and signals are added while the network is built, after freeze the
+    network is immutable. The geometry of all roads is also packed into flat
+    arrays, see packed."""
+    def __init__(self):
+        self.shapes = []
+        self.signals = []   # Groups of road indices of every traffic signal
+        self.frozen = False
+        self._packed = None
+        self.conflict_indices = {}
+
+    def __len__(self):
+        return len(self.shapes)
+
+    def _check_mutable(self):
+        if self.frozen:
+            raise ValueError('the road network is frozen')
+
+    def add_road(self, start, end, control=None):
+        """Adds a road and returns its index"""
+        self._check_mutable()
+        self.shapes.append(RoadShape(start, end, control))
+        self._packed = None
+        self.conflict_indices = {}
+        return len(self.shapes) - 1
+
+    def add_signal(self, road_groups):
+        """Adds a traffic signal controlling groups of road indices and returns its index"""
+        self._check_mutable()
+        self.signals.append([list(group) for group in road_groups])
+        self._packed = None
+        return len(self.signals) - 1
+
+    def freeze(self):
+        """Packs the network and makes it read only"""
+        for arr in self.packed.values():
+            arr.flags.writeable = False
+        self.frozen = True
+
+    @property
+    def packed(self):
+        """Arrays of the whole network, with one row per road unless noted.
+
+        starts, ends, lengths, headings (cos, sin at the end), curved
+        signal_ids, signal_groups: -1 for roads without a signal
+        lut_offsets (roads + 1): rows of each road in lut_points, lut_arc_lengths and lut_keys
+        lut_keys: arc lengths of all roads, one after the other with a gap of 1
+        successor_offsets (roads + 1), successor_ids: roads starting where a road ends"""
+        if self._packed is not None:
+            return self._packed
+
+        n = len(self.shapes)
+        counts = np.array([len(shape.points) for shape in self.shapes], dtype=int)
+        lut_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(int)
+        lengths = np.array([shape.length for shape in self.shapes], dtype=float)
+        key_offsets = np.concatenate([[0], np.cumsum(lengths + 1)[:-1]]) if n else np.zeros(0)
+
+        signal_ids = np.full(n, -1, dtype=int)
+        signal_groups = np.full(n, -1, dtype=int)
+        for signal_id, groups in enumerate(self.signals):
+            for group, road_ids in enumerate(groups):
+                signal_ids[road_ids] = signal_id
+                signal_groups[road_ids] = group
+
+        # Roads connect where one ends and the next starts
+        starting_at = {}
+        for i, shape in enumerate(self.shapes):
+            starting_at.setdefault(shape.start, []).append(i)
+        successors = [starting_at.get(shape.end, []) for shape in self.shapes]
+
+        packed = {
+            'starts': np.array([shape.start for shape in self.shapes], dtype=float).reshape(-1, 2),
+            'ends': np.array([shape.end for shape in self.shapes], dtype=float).reshape(-1, 2),
+            'lengths': lengths,
+            'headings': np.array([(shape.angle_cos, shape.angle_sin) for shape in self.shapes], dtype=float).reshape(-1, 2),
+            'curved': np.array([shape.control is not None for shape in self.shapes], dtype=bool),
+            'signal_ids': signal_ids,
+            'signal_groups': signal_groups,
+            'lut_offsets': lut_offsets,
+            'lut_points': np.concatenate([shape.points for shape in self.shapes]) if n else np.zeros((0, 2)),
+            'lut_arc_lengths': np.concatenate([shape.arc_lengths for shape in self.shapes]) if n else np.zeros(0),
+            'key_offsets': key_offsets,
+            'successor_offsets': np.concatenate([[0], np.cumsum([len(s) for s in successors])]).astype(int),
+            'successor_ids': np.array([j for s in successors for j in s], dtype=int)
+        }
+        packed['lut_keys'] = packed['lut_arc_lengths'] + np.repeat(key_offsets, counts)
+
+        # Keep one copy of the lookup tables, the shapes use views of the packed arrays
+        for i, shape in enumerate(self.shapes):
+            lo, hi = lut_offsets[i], lut_offsets[i+1]
+            shape.points = packed['lut_points'][lo:hi]
+            shape.arc_lengths = packed['lut_arc_lengths'][lo:hi]
+
+        self._packed = packed
+        return packed
+
+    def successors(self, index):
+        """Returns the indices of the roads starting where road *index* ends"""
+        packed = self.packed
+        lo, hi = packed['successor_offsets'][index:index+2]
+        return packed['successor_ids'][lo:hi]
+
+    def world_positions(self, road_ids, xs):
+        """Converts positions along roads to world positions"""
+        packed = self.packed
+        keys = packed['key_offsets'][road_ids] + np.clip(xs, 0, packed['lengths'][road_ids])
+        points = packed['lut_points']
+        return np.stack([
+            np.interp(keys, packed['lut_keys'], points[:, 0]),
+            np.interp(keys, packed['lut_keys'], points[:, 1])
+        ], axis=1)
+
+    def world_headings(self, road_ids, xs):
+        """Returns the directions (cos, sin) of the roads at positions along them"""
+        packed = self.packed
+        keys = packed['key_offsets'][road_ids] + np.clip(xs, 0, packed['lengths'][road_ids])
+        # Segment of the lookup table each position is on
+        i = np.searchsorted(packed['lut_keys'], keys, side='right') - 1
+        i = np.clip(i, packed['lut_offsets'][road_ids], packed['lut_offsets'][road_ids + 1] - 2)
+        deltas = packed['lut_points'][i + 1] - packed['lut_points'][i]
+        return deltas / np.hypot(deltas[:, 0], deltas[:, 1])[:, None]
+
+    def conflict_index(self, distance):
+        """Returns the ConflictIndex of the network for collisions closer than *distance*"""
+        if distance not in self.conflict_indices:
+            self.conflict_indices[distance] = ConflictIndex(self.shapes, distance)
+        return self.conflict_indices[distance]
@@ -0,0 +1,80 @@
+from threading import Event, Thread
+from time import perf_counter, sleep
+
+from .snapshot import Snapshot, interpolate_published
+
+
+class SimulationThread:
+    """Steps a simulation in its own thread and publishes snapshots of it.
+
+    The simulation runs as fast as possible, or at *speed* times real time. A
+    snapshot is published at most *publish_rate* times per second, and
+    snapshot() interpolates between the last two, so a reader that samples it
+    at any rate sees smooth motion one publish interval behind."""
+    def __init__(self, sim, config={}):
+        self.sim = sim
+
+        # Set default configuration
+        self.set_default_config()
+
+        # Update configuration
+        for attr, val in config.items():
+            setattr(self, attr, val)
+
+        # Calculate properties
+        self.init_properties()
+
+    def set_default_config(self):
+        self.speed = None       # Simulated seconds per real second, None runs as fast as possible
+        self.publish_rate = 60  # Snapshots per real second
+        self.steps = 0
+        self.error = None       # Exception that stopped the thread
+
+    def init_properties(self):
+        self.road_lengths = self.sim.network.packed['lengths']
+        self.snapshots = (None, None)   # Previous and latest, replaced together
+        self.stop_event = Event()
+        self.thread = Thread(target=self.run, daemon=True)
+
+    def publish(self, now):
+        snapshot = Snapshot.capture(self.sim)
+        snapshot.published = now
+        self.snapshots = (self.snapshots[1], snapshot)
+
+    def run(self):
+        start = perf_counter()
+        self.publish(start)
+        next_publish = start + 1/self.publish_rate
+        try:
+            while not self.stop_event.is_set():
+                if self.speed is not None:
+                    # Simulated time ahead of the target, sim.t restarts with every episode
+                    ahead = self.steps*self.sim.dt - self.speed*(perf_counter() - start)
+                    if ahead > 0:
+                        sleep(min(ahead/self.speed, 1/self.publish_rate))
+                        continue
+
+                self.sim.update()
+                self.steps += 1
+
+                now = perf_counter()
+                if now >= next_publish:
+                    self.publish(now)
+                    next_publish = now + 1/self.publish_rate
+        except Exception as e:
+            self.error = e
+            raise
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+
+    def snapshot(self, now=None):
+        """Returns the state to show at wall clock time *now*, None before the first snapshot"""
+        previous, latest = self.snapshots
+        now = perf_counter() if now is None else now
+        return interpolate_published(previous, latest, now, self.road_lengths)
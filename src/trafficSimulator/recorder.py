@@ -0,0 +1,483 @@
+from queue import Queue
+from threading import Thread
+from time import perf_counter
+import json
+import struct
+
+import numpy as np
+
+from .network import RoadNetwork
+from .snapshot import Snapshot
+
+__all__ = ['TrajectoryRecorder', 'TrajectoryReader', 'Replay', 'replay']
+
+MAGIC = b'TRAJ'
+CHUNK = np.dtype([
+    ('size', '<i8'),        # Bytes of the chunk with this header
+    ('first_step', '<i8'),
+    ('steps', '<i4'),
+    ('rows', '<i4'),        # Vehicle states
+    ('runs', '<i4'),        # Runs of rows on the same road
+    ('changes', '<i4'),     # Signal phase changes
+    ('vehicles', '<i4'),    # Distinct vehicles
+    ('groups', '<i4'),      # Signal groups
+    ('x_values', '<i4'),    # Rows whose x, v or a changed
+    ('v_values', '<i4'),
+    ('a_values', '<i4')
+])
+
+# Columns stored only for the rows where they changed since the previous row of the vehicle
+STATE_COLUMNS = ('x', 'v', 'a')
+
+
+def _columns(header):
+    """Name, type and length of every column of a chunk, in file order"""
+    steps, rows, runs, changes, vehicles = (
+        int(header[name]) for name in ('steps', 'rows', 'runs', 'changes', 'vehicles')
+    )
+    return [
+        ('counts', '<i4', steps),           # Vehicles in every step
+        ('frame_count', '<i8', steps),
+        ('t', '<f8', steps),
+        ('initial_signals', '?', int(header['groups'])),
+        ('change_steps', '<i4', changes),
+        ('change_groups', '<i4', changes),
+        ('change_states', '?', changes),
+        ('id_deltas', '<i4', rows),         # Difference to the id of the previous row
+        ('road_values', '<i4', runs),
+        ('road_runs', '<i4', runs),
+        *[column for name in STATE_COLUMNS for column in (
+            (f'{name}_changed', 'u1', (rows + 7) // 8),     # Bit per row
+            (name, '<f4', int(header[f'{name}_values']))
+        )],
+        ('vehicle_ids', '<i8', vehicles),   # Lengths are stored once per vehicle and chunk
+        ('vehicle_lengths', '<f4', vehicles)
+    ]
+
+
+def encode_chunk(first_step, counts, frame_count, t, signals, rows, lengths):
+    """Returns the bytes of a chunk of steps.
+
+    *signals* has the signal phases of every step, *rows* the ids, roads, x, v
+    and a of the vehicles of every step and *lengths* the length of every vehicle.
+    x, v and a are only stored for the rows where they differ from the previous
+    row of the same vehicle, so stopped vehicles cost a few bits per step."""
+    ids, roads, x, v, a = (np.concatenate([np.asarray(row[i]) for row in rows]) for i in range(5))
+    ids, roads = ids.astype(np.int64), roads.astype(int)
+    signals = np.array(signals, dtype=bool).reshape(len(counts), -1)
+
+    starts = np.flatnonzero(np.diff(roads)) + 1
+    starts = np.concatenate([[0], starts]) if len(roads) else starts
+    change_steps, change_groups = np.nonzero(signals[1:] != signals[:-1])
+    change_steps += 1
+    vehicle_ids = np.array(sorted(lengths), dtype=np.int64)
+
+    # Rows of every vehicle in step order, the first one of a vehicle is always stored
+    order = np.argsort(ids, kind='stable')
+    first = np.ones(len(ids), dtype=bool)
+    first[1:] = ids[order][1:] != ids[order][:-1]
+    changed = {}
+    states = {}
+    for name, column in zip(STATE_COLUMNS, (x, v, a)):
+        column = np.asarray(column).astype(np.float32)
+        by_vehicle = column[order]
+        mask = np.empty(len(ids), dtype=bool)
+        mask[order] = first
+        mask[order[1:]] |= by_vehicle[1:] != by_vehicle[:-1]
+        changed[f'{name}_changed'] = np.packbits(mask)
+        states[name] = column[mask]
+
+    header = np.zeros((), dtype=CHUNK)
+    header['first_step'] = first_step
+    header['steps'] = len(counts)
+    header['rows'] = len(ids)
+    header['runs'] = len(starts)
+    header['changes'] = len(change_steps)
+    header['vehicles'] = len(vehicle_ids)
+    header['groups'] = signals.shape[1]
+    for name in STATE_COLUMNS:
+        header[f'{name}_values'] = len(states[name])
+
+    data = {
+        'counts': counts,
+        'frame_count': frame_count,
+        't': t,
+        'initial_signals': signals[0],
+        'change_steps': change_steps,
+        'change_groups': change_groups,
+        'change_states': signals[change_steps, change_groups],
+        'id_deltas': np.diff(ids, prepend=0),
+        'road_values': roads[starts],
+        'road_runs': np.diff(np.append(starts, len(roads))),
+        **changed,
+        **states,
+        'vehicle_ids': vehicle_ids,
+        'vehicle_lengths': [lengths[i] for i in vehicle_ids.tolist()]
+    }
+    body = b''.join(
+        np.asarray(data[name]).astype(dtype).tobytes() for name, dtype, _ in _columns(header)
+    )
+    header['size'] = CHUNK.itemsize + len(body)
+    return header.tobytes() + body
+
+
+class TrajectoryRecorder:
+    """Records the vehicles and signal phases of every step of a Simulation.
+
+    Steps are collected into chunks of *chunk_steps* steps, which a background
+    thread encodes column by column and appends to the file at *path*, so the
+    simulation never waits for the disk. Roads and signals are written to the
+    header, a recording can be replayed without the scenario. Read it back with
+    TrajectoryReader."""
+    def __init__(self, path, config={}):
+        self.path = path
+
+        # Set default configuration
+        self.set_default_config()
+
+        # Update configuration
+        for attr, val in config.items():
+            setattr(self, attr, val)
+
+        self.sim = None
+        self.queue = Queue()
+        self.writer = None
+        self.init_chunk()
+
+    def set_default_config(self):
+        self.chunk_steps = 600  # Steps per chunk, 10 simulated seconds
+        self.steps = 0          # Steps recorded
+
+    def init_chunk(self):
+        self.first_step = self.steps
+        self.counts = []
+        self.frame_counts = []
+        self.times = []
+        self.signals = []
+        self.rows = []          # Arrays of id, road, x, v and a of every step
+        self.lengths = {}       # Vehicle id -> length
+
+    def attach(self, sim):
+        """Writes the header and records every following step of *sim*"""
+        network = sim.network
+        header = json.dumps({
+            'dt': sim.dt,
+            'roads': [[shape.start, shape.end, shape.control] for shape in network.shapes],
+            'signals': network.signals
+        }).encode()
+
+        self.file = open(self.path, 'wb')
+        self.file.write(MAGIC + struct.pack('<I', len(header)) + header)
+        self.file.flush()
+
+        self.writer = Thread(target=self.write, daemon=True)
+        self.writer.start()
+        self.sim = sim
+        sim.recorder = self
+        return self
+
+    def record(self, sim):
+        """Adds the current step of *sim*, called by Simulation.update"""
+        engine = sim.vehicle_engine
+        ids = []
+        roads = []
+        slots = []
+        states = []
+        lengths = self.lengths
+        for i in sorted(sim.occupied_roads):
+            vehicles = sim.roads[i].vehicles
+            roads.extend([i] * len(vehicles))
+            for vehicle in vehicles:
+                ids.append(vehicle.id)
+                if vehicle.id not in lengths:
+                    lengths[vehicle.id] = vehicle.l
+                if engine:
+                    slots.append(vehicle.slot)
+                else:
+                    states.append((vehicle.x, vehicle.v, vehicle.a))
+
+        if engine:
+            arrays = engine.arrays
+            x, v, a = arrays['x'][slots], arrays['v'][slots], arrays['a'][slots]
+        else:
+            x, v, a = np.array(states, dtype=float).reshape(-1, 3).T
+
+        self.counts.append(len(ids))
+        self.frame_counts.append(sim.frame_count)
+        self.times.append(sim.t)
+        self.signals.append([green for signal in sim.traffic_signals for green in signal.current_cycle])
+        self.rows.append((ids, roads, x, v, a))
+        self.steps += 1
+
+        if self.steps - self.first_step >= self.chunk_steps:
+            self.flush()
+
+    def flush(self):
+        """Hands the steps recorded so far to the writer thread"""
+        if self.steps == self.first_step:
+            return
+        self.queue.put((
+            self.first_step, self.counts, self.frame_counts, self.times, self.signals, self.rows, self.lengths
+        ))
+        self.init_chunk()
+
+    def write(self):
+        while True:
+            chunk = self.queue.get()
+            if chunk is None:
+                return
+            self.file.write(encode_chunk(*chunk))
+            self.file.flush()
+
+    def close(self):
+        """Writes the last steps, waits for the writer and detaches from the simulation"""
+        self.flush()
+        if self.writer is not None:
+            self.queue.put(None)
+            self.writer.join()
+            self.file.close()
+            self.writer = None
+        if self.sim is not None:
+            self.sim.recorder = None
+            self.sim = None
+
+
+class TrajectoryReader:
+    """Random access to a recording of TrajectoryRecorder through a memory map.
+
+    Steps are numbered from the start of the recording and step i is at
+    recorded time i * dt, whatever episodes the simulation went through.
+    A chunk torn by a crash is ignored, refresh picks up chunks appended
+    since the file was opened."""
+    def __init__(self, path):
+        self.path = path
+        self.decoded = {}   # Last decoded chunks by index
+        self._network = None
+        self.refresh()
+
+    def refresh(self):
+        self.data = np.memmap(self.path, dtype=np.uint8, mode='r')
+        if bytes(self.data[:4]) != MAGIC:
+            raise ValueError(f'{self.path} is not a trajectory recording')
+        size, = struct.unpack('<I', bytes(self.data[4:8]))
+        header = json.loads(bytes(self.data[8:8 + size]))
+        self.dt = header['dt']
+        self.roads = header['roads']
+        self.signals = header['signals']
+
+        # Index of the chunks, skipping from header to header
+        offsets = []
+        first_steps = []
+        steps = []
+        offset = 8 + size
+        while offset + CHUNK.itemsize <= len(self.data):
+            chunk = np.frombuffer(self.data, dtype=CHUNK, count=1, offset=offset)[0]
+            if offset + chunk['size'] > len(self.data):
+                break
+            offsets.append(offset)
+            first_steps.append(int(chunk['first_step']))
+            steps.append(int(chunk['steps']))
+            offset += int(chunk['size'])
+        self.offsets = offsets
+        self.first_steps = np.array(first_steps, dtype=int)
+        self.chunk_sizes = np.array(steps, dtype=int)
+        self.decoded = {}
+
+    def __len__(self):
+        """Number of steps recorded"""
+        return int(self.first_steps[-1] + self.chunk_sizes[-1]) if len(self.offsets) else 0
+
+    @property
+    def duration(self):
+        return len(self) * self.dt
+
+    @property
+    def network(self):
+        """RoadNetwork of the recorded roads and signals"""
+        if self._network is None:
+            self._network = RoadNetwork()
+            for start, end, control in self.roads:
+                self._network.add_road(start, end, control)
+            for groups in self.signals:
+                self._network.add_signal(groups)
+        return self._network
+
+    def build_simulation(self):
+        """Returns a Simulation with the recorded roads and signals, to draw the recording on"""
+        from .simulation import Simulation
+
+        sim = Simulation({"network": self.network, "dt": self.dt})
+        sim.create_roads(self.roads)
+        return sim
+
+    def step_at(self, t):
+        """Returns the step at recorded time *t*"""
+        return min(max(int(t / self.dt), 0), max(len(self) - 1, 0))
+
+    def chunk(self, i):
+        """Returns the columns of chunk *i*, decoded"""
+        if i in self.decoded:
+            return self.decoded[i]
+
+        offset = self.offsets[i]
+        header = np.frombuffer(self.data, dtype=CHUNK, count=1, offset=offset)[0]
+        offset += CHUNK.itemsize
+        raw = {}
+        for name, dtype, count in _columns(header):
+            raw[name] = np.frombuffer(self.data, dtype=dtype, count=count, offset=offset)
+            offset += np.dtype(dtype).itemsize * count
+
+        ids = np.cumsum(raw['id_deltas'], dtype=np.int64)
+
+        # Unchanged states repeat the last stored state of the vehicle
+        rows = len(ids)
+        order = np.argsort(ids, kind='stable')
+        states = {}
+        for name in STATE_COLUMNS:
+            mask = np.unpackbits(raw[f'{name}_changed'], count=rows).astype(bool)
+            last = np.maximum.accumulate(np.where(mask[order], np.arange(rows), 0))
+            source = np.empty(rows, dtype=int)
+            source[order] = order[last]
+            states[name] = raw[name][(np.cumsum(mask) - 1)[source]]
+        order = np.argsort(raw['vehicle_ids'])
+        signals = np.tile(raw['initial_signals'], (int(header['steps']), 1))
+        for step, group, state in zip(raw['change_steps'], raw['change_groups'], raw['change_states']):
+            signals[step:, group] = state
+
+        chunk = {
+            'row_offsets': np.concatenate([[0], np.cumsum(raw['counts'])]),
+            'frame_count': raw['frame_count'],
+            't': raw['t'],
+            'signals': signals,
+            'id': ids,
+            'road': np.repeat(raw['road_values'], raw['road_runs']).astype(int),
+            'x': states['x'],
+            'v': states['v'],
+            'a': states['a'],
+            'length': raw['vehicle_lengths'][order[np.searchsorted(raw['vehicle_ids'], ids, sorter=order)]]
+        }
+        # Enough for scrubbing back and forth across a chunk boundary
+        if len(self.decoded) >= 4:
+            self.decoded.pop(next(iter(self.decoded)))
+        self.decoded[i] = chunk
+        return chunk
+
+    def locate(self, step):
+        """Returns the chunk of *step* and its position in the chunk"""
+        i = int(np.searchsorted(self.first_steps, step, side='right')) - 1
+        return i, step - int(self.first_steps[i])
+
+    def frame(self, step):
+        """Returns the Snapshot of one step"""
+        i, j = self.locate(step)
+        chunk = self.chunk(i)
+        lo, hi = chunk['row_offsets'][j:j+2]
+        v = chunk['v'][lo:hi]
+        return Snapshot(
+            float(chunk['t'][j]), int(chunk['frame_count'][j]), float(v.mean()) if len(v) else 0.0,
+            chunk['id'][lo:hi], chunk['road'][lo:hi],
+            chunk['x'][lo:hi].astype(float), chunk['length'][lo:hi].astype(float),
+            chunk['signals'][j]
+        )
+
+    def read(self, t0=0, t1=None):
+        """Returns the vehicle states from recorded time *t0* to *t1* as columns.
+
+        step, t, id, road, x, v and a have one row per vehicle and step,
+        signals has one row per step."""
+        s0 = max(int(np.ceil(t0 / self.dt - 1e-9)), 0)
+        s1 = len(self) if t1 is None else min(int(t1 / self.dt) + 1, len(self))
+        parts = []
+        step = s0
+        while step < s1:
+            i, j = self.locate(step)
+            chunk = self.chunk(i)
+            k = min(j + s1 - step, int(self.chunk_sizes[i]))
+            lo, hi = chunk['row_offsets'][j], chunk['row_offsets'][k]
+            counts = np.diff(chunk['row_offsets'][j:k+1])
+            parts.append({
+                'step': np.repeat(np.arange(step, step + k - j), counts),
+                'id': chunk['id'][lo:hi],
+                'road': chunk['road'][lo:hi],
+                'x': chunk['x'][lo:hi],
+                'v': chunk['v'][lo:hi],
+                'a': chunk['a'][lo:hi],
+                'signals': chunk['signals'][j:k]
+            })
+            step += k - j
+
+        names = ('step', 'id', 'road', 'x', 'v', 'a', 'signals')
+        if not parts:
+            columns = {name: np.zeros(0) for name in names}
+            columns['signals'] = np.zeros((0, sum(len(groups) for groups in self.signals)), dtype=bool)
+        else:
+            columns = {name: np.concatenate([part[name] for part in parts]) for name in names}
+        columns['t'] = columns['step'] * self.dt
+        return columns
+
+
+class Replay:
+    """Plays a recording back as a Window source, at any speed and in both directions.
+
+    Keys: space pauses, left and right jump *jump* seconds, up and down double
+    or halve the speed and r reverses it."""
+    def __init__(self, reader, config={}):
+        self.reader = reader
+
+        # Set default configuration
+        self.set_default_config()
+
+        # Update configuration
+        for attr, val in config.items():
+            setattr(self, attr, val)
+
+        self.road_lengths = reader.network.packed['lengths']
+        self.last_now = None
+
+    def set_default_config(self):
+        self.speed = 1.0        # Recorded seconds per real second, negative plays backwards
+        self.position = 0.0     # Recorded time shown
+        self.paused = False
+        self.jump = 10.0
+        self.interpolate = True # Between steps, for smooth slow motion
+
+    def seek(self, t):
+        self.position = min(max(t, 0.0), max(self.reader.duration - self.reader.dt, 0.0))
+
+    def key_down(self, key):
+        if key == 'space':
+            self.paused = not self.paused
+        elif key == 'left':
+            self.seek(self.position - self.jump)
+        elif key == 'right':
+            self.seek(self.position + self.jump)
+        elif key == 'up':
+            self.speed *= 2
+        elif key == 'down':
+            self.speed /= 2
+        elif key == 'r':
+            self.speed = -self.speed
+
+    def snapshot(self, now=None):
+        """Returns the recorded state at the current position, None for an empty recording"""
+        if len(self.reader) == 0:
+            return None
+        now = perf_counter() if now is None else now
+        if self.last_now is not None and not self.paused:
+            self.seek(self.position + self.speed * (now - self.last_now))
+        self.last_now = now
+
+        steps = self.position / self.reader.dt
+        step = min(int(steps), len(self.reader) - 1)
+        snapshot = self.reader.frame(step)
+        if self.interpolate and step + 1 < len(self.reader) and steps > step:
+            snapshot = snapshot.interpolate(self.reader.frame(step + 1), steps - step, self.road_lengths)
+        return snapshot
+
+
+def replay(path, config={}, window_config={}):
+    """Shows the recording at *path* in a Window, see Replay for the keys"""
+    from .window import Window
+
+    reader = TrajectoryReader(path)
+    Window(reader.build_simulation(), dict(window_config, source=Replay(reader, config))).loop()
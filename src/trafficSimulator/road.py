@@ -1,23 +1,42 @@
-from scipy.spatial import distance
-from collections import deque
+import numpy as np
+from .lane import Lane
+
+
+def _shape_field(name):
+    def fget(self):
+        return getattr(self.shape, name)
+
+    return property(fget)
+
 
 class Road:
-    def __init__(self, start, end):
-        self.start = start
-        self.end = end
+    """The vehicles of one simulation on road *index* of a RoadNetwork"""
+    def __init__(self, network, index):
+        self.network = network
+        self.index = index
+        self.shape = network.shapes[index]
 
-        self.vehicles = deque()
+        self.vehicles = Lane()
+        self.speed_sum = 0  # Sum of the speeds of the vehicles on the road
 
-        self.init_properties()
+        self.has_traffic_signal = False
 
         self.metrics = {}
 
-    def init_properties(self):
-        self.length = distance.euclidean(self.start, self.end)
-        self.angle_sin = (self.end[1]-self.start[1]) / self.length
-        self.angle_cos = (self.end[0]-self.start[0]) / self.length
-        # self.angle = np.arctan2(self.end[1]-self.start[1], self.end[0]-self.start[0])
-        self.has_traffic_signal = False
+    def position(self, x):
+        """Returns the world position at distance *x* along the road"""
+        return (
+            self.start[0] + self.angle_cos * x,
+            self.start[1] + self.angle_sin * x
+        )
+
+    def heading(self, x):
+        """Returns the direction (cos, sin) of the road at distance *x*"""
+        return self.angle_cos, self.angle_sin
+
+    def segments(self):
+        """Returns the straight pieces of the road as (start, length, cos, sin)"""
+        return [(self.start, self.length, self.angle_cos, self.angle_sin)]
 
     def set_traffic_signal(self, signal, group):
         self.traffic_signal = signal
@@ -35,26 +54,29 @@ class Road:
     def n_vehicles(self):
         return len(self.vehicles)
 
+    def quiescent(self):
+        """Returns True if no vehicle on the road moves until its traffic signal changes"""
+        for vehicle in self.vehicles:
+            if vehicle.v != 0 or vehicle.a > 0:
+                return False
+        return True
+
     def update_metrics(self):
         avg_speed = 0
-        for v in self.vehicles:
-            avg_speed += v.v
-
         if len(self.vehicles) != 0:
-            avg_speed /= len(self.vehicles)
+            avg_speed = self.speed_sum / len(self.vehicles)
 
         self.metrics['avg_speed'] = avg_speed
 
     def update(self, dt):
         n = len(self.vehicles)
 
+        self.speed_sum = 0
         if n > 0:
-            # Update first vehicle
-            self.vehicles[0].update(None, dt)
-            # Update other vehicles
-            for i in range(1, n):
-                lead = self.vehicles[i-1]
-                self.vehicles[i].update(lead, dt)
+            # Update every vehicle behind its leader
+            for lead, vehicle in self.vehicles.pairs():
+                vehicle.update(lead, dt)
+                self.speed_sum += vehicle.v
 
              # Check for traffic signal
             if self.traffic_signal_state:
@@ -76,4 +98,35 @@ class Road:
         self.update_metrics()
     
     def reset(self):
-        self.vehicles.clear()
\ No newline at end of file
+        self.vehicles.clear()
+        self.speed_sum = 0
+        self.metrics['avg_speed'] = 0
+
+
+# The geometry is read from the shared network
+for _name in ('start', 'end', 'control', 'length', 'angle_cos', 'angle_sin', 'points', 'arc_lengths', 'trig'):
+    setattr(Road, _name, _shape_field(_name))
+
+
+class CurvedRoad(Road):
+    """A road along the quadratic Bezier curve from *start* to *end* through *control*"""
+    def _segment(self, x):
+        return min(max(np.searchsorted(self.arc_lengths, x, side='right') - 1, 0), len(self.trig) - 1)
+
+    def position(self, x):
+        i = self._segment(x)
+        d = x - self.arc_lengths[i]
+        return (
+            self.points[i][0] + self.trig[i][0] * d,
+            self.points[i][1] + self.trig[i][1] * d
+        )
+
+    def heading(self, x):
+        return tuple(self.trig[self._segment(x)])
+
+    def segments(self):
+        lengths = np.diff(self.arc_lengths)
+        return [
+            (tuple(self.points[i]), lengths[i], *self.trig[i])
+            for i in range(len(self.trig))
+        ]
@@ -0,0 +1,35 @@
+class Scenario:
+    """Roads, generators and signals of a simulation as plain data.
+
+    Records the same calls as a Simulation, so that a worker process can build
+    its own Simulation from a small picklable spec instead of receiving one."""
+    def __init__(self, spec=None):
+        spec = spec or {}
+        self.roads = list(spec.get("roads", []))
+        self.generators = list(spec.get("generators", []))
+        self.signals = list(spec.get("signals", []))
+
+    def create_road(self, start, end, control=None):
+        self.roads.append((start, end) if control is None else (start, end, control))
+
+    def create_roads(self, road_list):
+        for road in road_list:
+            self.create_road(*road)
+
+    def create_gen(self, config={}):
+        self.generators.append(config)
+
+    def create_signal(self, roads, config={}):
+        self.signals.append((roads, config))
+
+    def to_dict(self):
+        return {"roads": self.roads, "generators": self.generators, "signals": self.signals}
+
+    def build(self, sim, locks=None):
+        """Creates the roads, generators and signals in *sim*, signal i gets locks[i]"""
+        sim.create_roads(self.roads)
+        for config in self.generators:
+            sim.create_gen(config)
+        for i, (roads, config) in enumerate(self.signals):
+            sim.create_signal(roads, locks[i] if locks else None, config)
+        return sim
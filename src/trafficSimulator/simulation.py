@@ -1,13 +1,16 @@
-from .road import Road
-from copy import deepcopy
+from .road import Road, CurvedRoad
+from .engine import VectorizedEngine
+from .collision import COLLISION_DETECTORS
+from .network import RoadNetwork
+from .metrics import Metrics
 from .vehicle_generator import VehicleGenerator
 from .traffic_signal import TrafficSignal
+from .snapshot import Snapshot
 from .learning.Agent import Agent
-from time import sleep, time
-import math
-
-def check_collision(pos1, pos2):
-    return math.sqrt((pos1[0] - pos2[0])**2 + (pos1[1] - pos2[1])**2) < 2
+from .learning.qtable import BufferedQTable
+from time import time
+import heapq
+import numpy as np
 
 class Simulation:
     def __init__(self, config={}):
@@ -16,29 +19,79 @@ class Simulation:
         # Update configuration
         for attr, val in config.items():
             setattr(self, attr, val)
+        # Calculate properties
+        self.init_properties()
 
     def set_default_config(self):
         self.t = 0.0            # Time keeping
         self.frame_count = 0    # Frame count keeping
+        self.vehicles_added = 0 # Id of the next vehicle, never reset
+        self.total_collisions = 0   # Collisions of every episode, never reset
         self.dt = 1/60          # Simulation time step
         self.roads = []         # Array to store roads
+        self.network = None         # RoadNetwork shared with other simulations, None for a new one
+        self.id = 0
+        self.shared_metrics = None  # Queue of episode summaries, filled by simulation 0
+        self.seed = None            # Seeds every random stream of the simulation, None keeps the defaults
+        self.occupied_roads = set() # Indices of roads with vehicles
+        self.active_roads = set()   # Occupied roads whose vehicles can still move
+        self.signal_roads = []      # Indices of roads with a traffic signal
         self.generators = []
         self.traffic_signals = []
         self.agents = []
         self.configs = []
         self.multithreaded = False
         self.sarsa = False
-        self.metrics = {
-            "collisions": 0,
-            "avg_speed": 0,
-            "vehicles": [],
-            "vehicle_count": 0,
-            "vehicles_per_signal": {},
-            "episodes": 0
-        }
+        self.q_table_backend = "dict"  # "dict" or "array", see learning.qtable
+        self.q_update_merge = None     # Merge strategy of buffered shared Q-table updates, None writes through
+        self.merge_every_episodes = 1
+        self.merge_every_seconds = None
+        self.engine = "object"  # "object" or "vectorized"
+        self.collision_detection = "spatial_hash"  # A name in COLLISION_DETECTORS or a detector
+        self.conflict_zones = True  # Only check vehicles where roads come close to each other
+        self.metric_periods = {}    # Frames a metric is reused for before it is computed again
+        self.snapshot_buffer = None # SnapshotBuffer that run_episodes publishes snapshots to
+        self.snapshot_interval = 1/30   # Seconds between snapshots
+        self.recorder = None        # TrajectoryRecorder recording every step, see TrajectoryRecorder.attach
+
+    def init_properties(self):
+        if self.network is None:
+            self.network = RoadNetwork()
+
+        if self.engine == "vectorized":
+            self.vehicle_engine = VectorizedEngine()
+        else:
+            self.vehicle_engine = None
+
+        # Counters are updated as they happen, the rest is computed when read
+        self.metrics = Metrics(self, {"collisions": 0, "episodes": 0})
+        self.metrics.register("avg_speed", self._metric_avg_speed)
+        self.metrics.register("vehicles", self._metric_vehicles)
+        self.metrics.register("vehicle_count", self._metric_vehicle_count)
+        self.metrics.register("vehicles_per_signal", self._metric_vehicles_per_signal)
+        self.metrics.register("active_roads", self._metric_active_roads)
+        for name, period in self.metric_periods.items():
+            self.metrics.set_period(name, period)
+
+        # State key of the frame it was computed in, kept out of the metrics
+        self.state_key_frame = None
+        self.state_key_cache = None
+
+        if isinstance(self.collision_detection, str):
+            self.collision_detector = COLLISION_DETECTORS[self.collision_detection]()
+        else:
+            self.collision_detector = self.collision_detection
+
+    def create_road(self, start, end, control=None):
+        index = len(self.roads)
+        if index == len(self.network):
+            self.network.add_road(start, end, control)
+        # Otherwise the road is already in a shared network
 
-    def create_road(self, start, end):
-        road = Road(start, end)
+        if self.network.shapes[index].control is None:
+            road = Road(self.network, index)
+        else:
+            road = CurvedRoad(self.network, index)
         self.roads.append(road)
         return road
 
@@ -46,9 +99,17 @@ class Simulation:
         for road in road_list:
             self.create_road(*road)
 
+    def child_seed(self, *key):
+        """Returns the seed of the random stream *key*, derived from the seed of the simulation"""
+        if self.seed is None:
+            return None
+        return int(np.random.SeedSequence([self.seed, *key]).generate_state(1)[0])
+
     def create_gen(self, config={}, init=True):
         if init:
             self.configs.append(config)
+        if self.seed is not None:
+            config = dict(config, seed=self.child_seed(0, len(self.generators)))
         gen = VehicleGenerator(self, config)
         self.generators.append(gen)
         return gen
@@ -56,8 +117,15 @@ class Simulation:
     def create_signal(self, roads, lock=None, config={}):
         roads = [[self.roads[i] for i in road_group] for road_group in roads]
 
+        if len(self.traffic_signals) == len(self.network.signals):
+            self.network.add_signal([[road.index for road in group] for group in roads])
+
         sig = TrafficSignal(roads, config)
+        sig.listeners.append(self.wake_signal)
         self.traffic_signals.append(sig)
+        self.signal_roads = sorted(
+            set(self.signal_roads) | {road.index for group in roads for road in group}
+        )
 
         if self.id == 0:
             epsilon = 0.0
@@ -69,12 +137,29 @@ class Simulation:
             "alpha": 1,
             "gamma": 0.4,
             "multithreaded": self.multithreaded,
-            "lock": lock
+            "q_table_backend": self.q_table_backend,
+            "merge_strategy": self.q_update_merge,
+            "merge_every_episodes": self.merge_every_episodes,
+            "merge_every_seconds": self.merge_every_seconds,
+            "lock": lock,
+            "seed": self.child_seed(1, len(self.agents))
         })
 
         self.agents.append(agent)
         return sig
 
+    def activate_road(self, index):
+        """Marks a road that a vehicle entered as occupied and active"""
+        self.occupied_roads.add(index)
+        self.active_roads.add(index)
+
+    def wake_signal(self, signal):
+        """Reactivates the occupied roads of a signal that changed phase"""
+        for group in signal.roads:
+            for road in group:
+                if road.index in self.occupied_roads:
+                    self.active_roads.add(road.index)
+
     @property
     def state(self):
         vehicles = {}
@@ -88,50 +173,89 @@ class Simulation:
         return [list(vehicles), [sig.current_cycle_index for sig in self.traffic_signals]]
         #return [list(self.metrics['vehicles_per_signal']), [sig.current_cycle_index for sig in self.traffic_signals]]
 
+    @property
+    def state_key(self):
+        """Hashable encoding of the state, computed once per frame and shared by all agents"""
+        frame = (self.metrics["episodes"], self.frame_count)
+        if frame != self.state_key_frame:
+            self.state_key_cache = self._compute_state_key()
+            self.state_key_frame = frame
+        return self.state_key_cache
 
-    def update_metrics(self):
-        vehicles = []
-        vehicle_count = []
-        vehicles_per_signal = {}
+
+    def _metric_avg_speed(self):
+        # Average speed on signal roads, kept from running sums of the roads
         avg_speed = 0
         total_vehicles = 1
-        for i, r in enumerate(self.roads):
-            for v in r.vehicles:
-                vehicles.append((i, int(v.x)))
-            if r.has_traffic_signal:
-                vehicle_count.append(len(r.vehicles))
-                for v in r.vehicles:
-                    if i in vehicles_per_signal:
-                        vehicles_per_signal[i] += 1
-                    else:
-                        vehicles_per_signal[i] = 1
-
-                    total_vehicles += 1
-                    avg_speed += v.v
-
-        self.metrics["avg_speed"] = avg_speed/total_vehicles
-        self.metrics["vehicles"] = vehicles
-        self.metrics["vehicle_count"] = vehicle_count
-        self.metrics["vehicles_per_signal"] = vehicles_per_signal
+        for i in self.signal_roads:
+            avg_speed += self.roads[i].speed_sum
+            total_vehicles += len(self.roads[i].vehicles)
+        return avg_speed/total_vehicles
 
-    def _check_collisions(self):
+    def _metric_vehicles(self):
         vehicles = []
+        for i in sorted(self.occupied_roads):
+            for v in self.roads[i].vehicles:
+                vehicles.append((i, int(v.x)))
+        return vehicles
+
+    def _metric_vehicle_count(self):
+        return [len(self.roads[i].vehicles) for i in self.signal_roads]
+
+    def _metric_vehicles_per_signal(self):
+        return {
+            i: len(self.roads[i].vehicles)
+            for i in self.signal_roads if len(self.roads[i].vehicles) > 0
+        }
+
+    def _metric_active_roads(self):
+        return len(self.active_roads)
+
+    def _compute_state_key(self):
+        # Occupied (road, 20m section) pairs in order, then the signal phases
+        sections = {}
+        for i in sorted(self.occupied_roads):
+            for v in self.roads[i].vehicles:
+                sections[(i, int(v.x) // 20)] = None
+        return (
+            tuple(sections),
+            tuple(int(sig.current_cycle_index) for sig in self.traffic_signals)
+        )
+
+    def vehicle_coordinates(self):
+        """Returns the road index and position along the road of all vehicles"""
+        road_ids = []
         xs = []
-        ys = []
-        for i, road in enumerate(self.roads):
-            for vehicle in road.vehicles:
-                sin, cos = road.angle_sin, road.angle_cos
-                x = road.start[0] + cos * vehicle.x 
-                y = road.start[1] + sin * vehicle.x 
-                vehicles += [(x, y, i)]
-                xs.append(x)
-                ys.append(y)
-
-        for i, v1 in enumerate(vehicles):
-            for i2 in range(i + 1, len(vehicles)):
-                v2 = vehicles[i2]
-                if v1[2] != v2[2] and check_collision(v1, v2):
-                    self.metrics["collisions"] += 1
+        for i in sorted(self.occupied_roads):
+            road = self.roads[i]
+            n = len(road.vehicles)
+            road_ids.extend([i] * n)
+            xs.extend(vehicle.x for vehicle in road.vehicles)
+
+        return np.array(road_ids, dtype=int), np.array(xs, dtype=float)
+
+    def world_positions(self, road_ids, xs):
+        """Converts positions along roads to world positions"""
+        return self.network.world_positions(road_ids, xs)
+
+    def vehicle_positions(self):
+        """Returns the world positions of all vehicles and the index of their road"""
+        road_ids, xs = self.vehicle_coordinates()
+        return self.world_positions(road_ids, xs), road_ids
+
+    def _check_collisions(self):
+        road_ids, xs = self.vehicle_coordinates()
+
+        if self.conflict_zones:
+            # Built once per network and distance
+            conflict_index = self.network.conflict_index(self.collision_detector.distance)
+            inside = conflict_index.contains(road_ids, xs)
+            road_ids, xs = road_ids[inside], xs[inside]
+
+        positions = self.world_positions(road_ids, xs)
+        collisions = self.collision_detector.detect(positions, road_ids)
+        self.metrics["collisions"] += collisions
+        self.total_collisions += collisions
 
     def update(self):
         # Update every road
@@ -145,41 +269,72 @@ class Simulation:
         #for sig in self.traffic_signals:
         #    sig.update(self)
 
-        for road in self.roads:
-            road.update(self.dt)
+        # Only roads with vehicles that can move need an update
+        active = sorted(self.active_roads)
+        if self.vehicle_engine:
+            self.vehicle_engine.update([self.roads[i] for i in active], self.dt)
+        else:
+            for i in active:
+                self.roads[i].update(self.dt)
 
         # Add vehicles
         for gen in self.generators:
             gen.update()
         
 
-        # Check roads for out of bounds vehicle
-        for road in self.roads:
-            # If road has no vehicles, continue
-            if len(road.vehicles) == 0: continue
-            # If not
-            vehicle = road.vehicles[0]
-            # If first vehicle is out of road bounds
-            if vehicle.x >= road.length:
+        # Check active roads for out of bounds vehicles, in order of index
+        # so that a vehicle can pass several roads in one step
+        pending = sorted(self.active_roads)
+        visited = set()
+        while pending:
+            i = heapq.heappop(pending)
+            if i in visited: continue
+            visited.add(i)
+            road = self.roads[i]
+            # Hand off every vehicle past the end of the road
+            while len(road.vehicles) > 0 and road.vehicles[0].x >= road.length:
+                vehicle = road.vehicles.popleft()
+                road.speed_sum -= vehicle.v
                 # If vehicle has a next road
                 if vehicle.current_road_index + 1 < len(vehicle.path):
-                    # Update current road to next road
+                    # Move the vehicle itself to the next road and carry over
+                    # the distance it travelled past the end of this one
                     vehicle.current_road_index += 1
-                    # Create a copy and reset some vehicle properties
-                    new_vehicle = deepcopy(vehicle)
-                    new_vehicle.x = 0
-                    # Add it to the next road
-                    next_road_index = vehicle.path[vehicle.current_road_index]
-                    self.roads[next_road_index].vehicles.append(new_vehicle)
-                # In all cases, remove it from its road
-                road.vehicles.popleft() 
-            
+                    next_index = vehicle.path[vehicle.current_road_index]
+                    next_road = self.roads[next_index]
+                    x = vehicle.x - road.length
+                    if len(next_road.vehicles) > 0:
+                        # Never overtake the last vehicle of the next road
+                        x = min(x, next_road.vehicles[-1].x)
+                    vehicle.x = x
+                    next_road.vehicles.append(vehicle)
+                    next_road.speed_sum += vehicle.v
+                    self.activate_road(next_index)
+                    if next_index > i:
+                        heapq.heappush(pending, next_index)
+                elif self.vehicle_engine:
+                    # Vehicle leaves the network
+                    self.vehicle_engine.release(vehicle)
+
+        # Deactivate roads that became empty or where no vehicle can move
+        for i in visited:
+            road = self.roads[i]
+            if len(road.vehicles) == 0:
+                road.speed_sum = 0
+                road.metrics['avg_speed'] = 0
+                self.occupied_roads.discard(i)
+                self.active_roads.discard(i)
+            elif road.quiescent():
+                self.active_roads.discard(i)
+
         self._check_collisions()
 
         # Increment time
         self.t += self.dt
         self.frame_count += 1
-        self.update_metrics()
+
+        if self.recorder is not None:
+            self.recorder.record(self)
         
         if self.metrics["collisions"] > 1 or self.frame_count % (reset_time / self.dt) == (reset_time / self.dt - 1):
             self.reset()
@@ -197,29 +352,63 @@ class Simulation:
     def run(self, steps=None):
         for _ in range(steps):
             self.update()
+
+    def run_episodes(self, episodes=None, seconds=None, stop=None):
+        """Runs until *episodes* more episodes ended, *seconds* passed or *stop* is set.
+
+        Buffered Q-table updates are merged before returning."""
+        start = time()
+        next_snapshot = start
+        first_episode = self.metrics["episodes"]
+        while True:
+            if episodes is not None and self.metrics["episodes"] - first_episode >= episodes:
+                break
+            if seconds is not None and time() - start >= seconds:
+                break
+            if stop is not None and stop.is_set():
+                break
+            self.update()
+
+            if self.snapshot_buffer is not None and time() >= next_snapshot:
+                self.snapshot_buffer.publish(Snapshot.capture(self))
+                next_snapshot = time() + self.snapshot_interval
+
+        for agent in self.agents:
+            if isinstance(agent.q_table, BufferedQTable):
+                agent.q_table.merge()
+
+        elapsed = time() - start
+        done = self.metrics["episodes"] - first_episode
+        return {
+            "id": self.id,
+            "episodes": done,
+            "seconds": elapsed,
+            "episodes_per_second": done / elapsed if elapsed > 0 else 0
+        }
         
     def reset(self):
         for agent in self.agents:
             agent.update()
 
-        if self.id == 0:
+        if self.id == 0 and self.shared_metrics is not None:
             self.shared_metrics.put({
                 "avg_speed": self.metrics["avg_speed"],
                 "collisions": self.metrics["collisions"],
                 "steps": self.t,
-                "episodes": self.metrics["episodes"]
+                "episodes": self.metrics["episodes"],
+                "worker": self.id,
+                "wall_time": time()
             })
 
         self.t = 0.0
         self.frame_count = 0
-        self.metrics = {
+        self.metrics.reset({
             "collisions": 0,
-            "avg_speed": 0,
-            "vehicles": [],
-            "vehicle_count": 0,
-            "vehicles_per_signal": {},
             "episodes": self.metrics["episodes"] + 1
-        }
+        })
+
+        self.occupied_roads = set()
+        self.active_roads = set()
 
         self.generators = []
 
@@ -228,6 +417,9 @@ class Simulation:
 
         for road in self.roads:
             road.reset()
+
+        if self.vehicle_engine:
+            self.vehicle_engine.reset()
         
         for agent in self.agents:
             agent.reset()
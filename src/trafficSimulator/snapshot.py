@@ -0,0 +1,93 @@
+import numpy as np
+
+
+class Snapshot:
+    """The state of a simulation at one frame, all that Window needs to draw it.
+
+    Vehicles are stored as arrays in road order: id, road index, position along
+    the road and length. signals holds whether each group of each signal is
+    green, signal after signal."""
+    def __init__(self, t=0.0, frame_count=0, avg_speed=0.0, ids=None, road_ids=None, xs=None, lengths=None, signals=None):
+        self.t = t
+        self.frame_count = frame_count
+        self.avg_speed = avg_speed
+        self.ids = np.zeros(0, dtype=np.int64) if ids is None else ids
+        self.road_ids = np.zeros(0, dtype=int) if road_ids is None else road_ids
+        self.xs = np.zeros(0) if xs is None else xs
+        self.lengths = np.zeros(0) if lengths is None else lengths
+        self.signals = np.zeros(0, dtype=bool) if signals is None else signals
+        self.published = 0.0    # Wall clock time it was published at
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def capture(cls, sim):
+        """Returns the snapshot of the current frame of *sim*"""
+        ids = []
+        road_ids = []
+        xs = []
+        lengths = []
+        for road in sim.roads:
+            if len(road.vehicles) == 0:
+                continue
+            road_ids.extend([road.index] * len(road.vehicles))
+            for vehicle in road.vehicles:
+                ids.append(getattr(vehicle, 'id', -1))
+                xs.append(vehicle.x)
+                lengths.append(vehicle.l)
+
+        signals = [
+            bool(green) for signal in sim.traffic_signals for green in signal.current_cycle
+        ]
+        return cls(
+            sim.t, sim.frame_count, sim.metrics["avg_speed"],
+            np.array(ids, dtype=np.int64), np.array(road_ids, dtype=int),
+            np.array(xs, dtype=float), np.array(lengths, dtype=float),
+            np.array(signals, dtype=bool)
+        )
+
+    def interpolate(self, other, alpha, road_lengths):
+        """Returns the snapshot a fraction *alpha* of the way from this one to *other*.
+
+        Vehicles are matched by id and move along their path, so a vehicle that
+        entered the next road first drives over the end of its previous one.
+        Vehicles only in *other* stay where they are in it."""
+        if alpha >= 1 or len(self) == 0:
+            return other
+
+        road_ids = other.road_ids.copy()
+        xs = other.xs.copy()
+
+        # Position of every vehicle of other in this snapshot
+        order = np.argsort(self.ids)
+        j = order[np.minimum(np.searchsorted(self.ids, other.ids, sorter=order), len(order) - 1)]
+        matched = self.ids[j] == other.ids
+        ra, xa = self.road_ids[j[matched]], self.xs[j[matched]]
+        rb, xb = other.road_ids[matched], other.xs[matched]
+
+        left = np.where(ra != rb, road_lengths[ra], 0)
+        x = xa + (xb + left - xa) * alpha
+        on_previous = x < left
+        road_ids[matched] = np.where(on_previous, ra, rb)
+        xs[matched] = np.where(on_previous, x, x - left)
+
+        return Snapshot(
+            self.t + (other.t - self.t) * alpha,
+            other.frame_count,
+            self.avg_speed + (other.avg_speed - self.avg_speed) * alpha,
+            other.ids, road_ids, xs, other.lengths,
+            self.signals
+        )
+
+
+def interpolate_published(previous, latest, now, road_lengths):
+    """Returns the state between two snapshots at wall clock time *now*.
+
+    *latest* is reached one publish interval after it was published, so that
+    the motion stays smooth however irregularly snapshots arrive."""
+    if previous is None:
+        return latest
+    interval = latest.published - previous.published
+    alpha = (now - latest.published) / interval if interval > 0 else 1
+    return previous.interpolate(latest, max(alpha, 0), road_lengths)
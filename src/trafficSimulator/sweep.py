@@ -0,0 +1,141 @@
+from multiprocessing import cpu_count, Pool
+from statistics import NormalDist
+import csv
+import itertools
+import time
+
+import numpy as np
+
+
+def parameter_grid(grid):
+    """Returns every combination of a dict of lists as a list of dicts"""
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*grid.values())]
+
+
+def run_headless(sim, steps, sample_every=60):
+    """Runs *sim* for *steps* frames and returns its summary metrics"""
+    speeds = []
+    # The collisions metric restarts with every episode, the total does not
+    collisions = sim.total_collisions
+    start = time.time()
+    for step in range(steps):
+        sim.update()
+        if step % sample_every == 0:
+            speeds.append(sim.metrics["avg_speed"])
+
+    return {
+        "avg_speed": float(np.mean(speeds)) if speeds else 0.0,
+        "collisions": sim.total_collisions - collisions,
+        "vehicles": sum(len(road.vehicles) for road in sim.roads),
+        "episodes": sim.metrics["episodes"],
+        "seconds": time.time() - start
+    }
+
+
+def _run_job(job):
+    factory, params, point, replication, seed, steps, sample_every = job
+    sim = factory(params, seed)
+    summary = run_headless(sim, steps, sample_every)
+    return {"point": point, "replication": replication, "seed": seed, **params, **summary}
+
+
+class Sweep:
+    """Runs a scenario for every point of a parameter grid in a process pool.
+
+    *factory(params, seed)* builds the Simulation of one run, and should pass
+    *seed* to its config. It is called in the worker processes, so it has to be
+    a module level function. Each point is replicated at least
+    *min_replications* times and at most *max_replications* times. It stops
+    early once the confidence interval of *metric* is narrower than *tolerance*
+    times its mean."""
+    def __init__(self, factory, grid, config={}):
+        self.factory = factory
+        self.points = parameter_grid(grid) if isinstance(grid, dict) else list(grid)
+
+        # Set default configuration
+        self.set_default_config()
+
+        # Update configuration
+        for attr, val in config.items():
+            setattr(self, attr, val)
+
+        self.results = []
+
+    def set_default_config(self):
+        self.workers = None     # Defaults to the number of cores
+        self.steps = 7200       # Frames of every run
+        self.sample_every = 60  # Frames between samples of avg_speed
+        self.seed = 0
+        self.min_replications = 1
+        self.max_replications = 1
+        self.metric = "avg_speed"
+        self.confidence = 0.95
+        self.tolerance = 0.05
+
+    def run_seed(self, point, replication):
+        """Returns the seed of one run, independent of the order runs are scheduled in"""
+        return int(np.random.SeedSequence([self.seed, point, replication]).generate_state(1)[0])
+
+    def converged(self, point):
+        values = [row[self.metric] for row in self.results if row["point"] == point]
+        if len(values) < max(self.min_replications, 2):
+            return len(values) >= self.max_replications
+        if len(values) >= self.max_replications:
+            return True
+
+        mean, half_width = self.interval(values)
+        return half_width <= self.tolerance * abs(mean)
+
+    def interval(self, values):
+        """Returns the mean of *values* and the half width of its confidence interval"""
+        z = NormalDist().inv_cdf((1 + self.confidence) / 2)
+        return float(np.mean(values)), z * float(np.std(values, ddof=1)) / len(values) ** 0.5
+
+    def jobs(self, point, replications):
+        done = sum(row["point"] == point for row in self.results)
+        return [
+            (self.factory, self.points[point], point, r, self.run_seed(point, r), self.steps, self.sample_every)
+            for r in range(done, done + replications)
+        ]
+
+    def run(self):
+        """Runs the sweep and returns one row per run"""
+        self.results = []
+        pending = list(range(len(self.points)))
+        with Pool(self.workers or cpu_count()) as pool:
+            # Every point gets its minimum, then one more replication per round
+            jobs = [job for point in pending for job in self.jobs(point, max(self.min_replications, 1))]
+            while jobs:
+                self.results.extend(pool.imap_unordered(_run_job, jobs))
+                pending = [point for point in pending if not self.converged(point)]
+                jobs = [job for point in pending for job in self.jobs(point, 1)]
+
+        self.results.sort(key=lambda row: (row["point"], row["replication"]))
+        return self.results
+
+    def summary(self):
+        """Returns one row per point with the mean and confidence interval of the metric"""
+        rows = []
+        for point, params in enumerate(self.points):
+            values = [row[self.metric] for row in self.results if row["point"] == point]
+            if not values:
+                continue
+            mean, half_width = self.interval(values) if len(values) > 1 else (values[0], float('inf'))
+            rows.append({
+                **params,
+                "replications": len(values),
+                self.metric: mean,
+                f"{self.metric}_ci": half_width
+            })
+        return rows
+
+    def save_csv(self, path, rows=None):
+        """Writes *rows*, by default the results, as a CSV table"""
+        rows = self.results if rows is None else rows
+        if not rows:
+            return
+        with open(path, 'w', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
@@ -4,6 +4,8 @@ class TrafficSignal:
     def __init__(self, roads, config={}):
         # Initialize roads
         self.roads = roads
+        # Called with the signal whenever it changes phase
+        self.listeners = []
         # Set default configuration
         self.set_default_config()
         # Update configuration
@@ -42,6 +44,18 @@ class TrafficSignal:
 
         self.metrics = {"cycle_time": cycle_time}
 
+    @property
+    def current_cycle_index(self):
+        return self._current_cycle_index
+
+    @current_cycle_index.setter
+    def current_cycle_index(self, val):
+        changed = val != getattr(self, '_current_cycle_index', None)
+        self._current_cycle_index = val
+        if changed:
+            for listener in self.listeners:
+                listener(self)
+
     @property
     def current_cycle(self):
         return self.cycle[self.current_cycle_index]
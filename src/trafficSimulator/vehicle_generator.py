@@ -23,9 +23,10 @@ class VehicleGenerator:
             (1, {})
         ]
         self.last_added_time = 0
+        self.seed = 2021
 
     def init_properties(self):
-        self.rng = np.random.default_rng(2021)
+        self.rng = np.random.default_rng(self.seed)
         self.upcoming_vehicle = self.generate_vehicle()
 
     def generate_vehicle(self):
@@ -42,12 +43,19 @@ class VehicleGenerator:
         if self.sim.t - self.last_added_time >= 60 / self.vehicle_rate:
             # If time elasped after last added vehicle is
             # greater than vehicle_period; generate a vehicle
-            road = self.sim.roads[self.upcoming_vehicle.path[0]]      
+            road_index = self.upcoming_vehicle.path[0]
+            road = self.sim.roads[road_index]
             if len(road.vehicles) == 0\
                or road.vehicles[-1].x > self.upcoming_vehicle.s0 + self.upcoming_vehicle.l:
                 # If there is space for the generated vehicle; add it
                 self.upcoming_vehicle.time_added = self.sim.t
+                self.upcoming_vehicle.id = self.sim.vehicles_added
+                self.sim.vehicles_added += 1
+                if self.sim.vehicle_engine:
+                    self.sim.vehicle_engine.bind(self.upcoming_vehicle)
                 road.vehicles.append(self.upcoming_vehicle)
+                road.speed_sum += self.upcoming_vehicle.v
+                self.sim.activate_road(road_index)
                 # Reset last_added_time and upcoming_vehicle
                 self.last_added_time = self.sim.t
             self.upcoming_vehicle = self.generate_vehicle()
@@ -1,13 +1,27 @@
-import pygame
-from pygame import gfxdraw
 import numpy as np
 
-import numpy as np
-import matplotlib.pyplot as plt
+from .snapshot import Snapshot
+from .realtime import SimulationThread
+
+__all__ = ['Window']
+
+# Imported when the first Window is created, so that headless simulations never load them
+pygame = None
+gfxdraw = None
+plt = None
+
+
+def _import_rendering():
+    global pygame, gfxdraw, plt
+    import pygame
+    from pygame import gfxdraw
+    import matplotlib.pyplot as plt
 
 
 class Window:
     def __init__(self, sim, config={}):
+        _import_rendering()
+
         # Simulation to draw
         self.sim = sim
 
@@ -28,12 +42,24 @@ class Window:
         self.zoom = 5
         self.offset = (0, 0)
 
+        self.vehicle_mode = "box"   # "box", "line" or "point"
+        self.point_mode_above = None    # Number of vehicles above which they are drawn as points
+
+        # Object whose snapshot() is drawn instead of the simulation, see SimulationThread
+        self.source = None
+        self.snapshot = None
+
         self.mouse_last = (0, 0)
         self.mouse_down = False
 
         self.plot_x = []
         self.plot_y = []
 
+        # Background and roads, drawn again only when the view changes
+        self.static_layer = None
+        self.static_key = None
+        self.road_boxes = np.zeros((0, 4))
+
 
     def loop(self, loop=None):
         """Shows a window visualizing the simulation and runs the loop function."""
@@ -92,7 +118,10 @@ class Window:
                         x2, y2 = pygame.mouse.get_pos()
                         self.offset = ((x2-x1)/self.zoom, (y2-y1)/self.zoom)
                 elif event.type == pygame.MOUSEBUTTONUP:
-                    self.mouse_down = False           
+                    self.mouse_down = False
+                # Keys control the source, like the playback of a Replay
+                elif event.type == pygame.KEYDOWN and hasattr(self.source, 'key_down'):
+                    self.source.key_down(pygame.key.name(event.key))           
 
     def run(self, steps_per_update=1):
         """Runs the simulation by updating in every loop."""
@@ -100,6 +129,22 @@ class Window:
             sim.run(steps_per_update)
         self.loop(loop)
 
+    def run_in_background(self, speed=None, publish_rate=60):
+        """Steps the simulation in another thread, as fast as possible or at *speed*
+        times real time, and draws its latest state at the display rate."""
+        self.source = SimulationThread(self.sim, {"speed": speed, "publish_rate": publish_rate}).start()
+        try:
+            self.loop()
+        finally:
+            self.source.stop()
+            self.source = None
+
+    def convert_array(self, points):
+        """Converts an (..., 2) array of simulation coordinates to screen coordinates"""
+        return np.stack([
+            self.width/2 + (points[..., 0] + self.offset[0])*self.zoom,
+            self.height/2 + (points[..., 1] + self.offset[1])*self.zoom
+        ], axis=-1).astype(int)
 
     def convert(self, x, y=None):
         """Converts simulation coordinates to screen coordinates"""
@@ -181,6 +226,26 @@ class Window:
 
         self.polygon(vertices, color, filled=filled)
 
+    def box_vertices(self, positions, sizes, cos, sin):
+        """Returns the (n, 4, 2) screen vertices of n centered rotated boxes"""
+        corners = np.array([(-1, -1), (-1, 1), (1, 1), (1, -1)])
+        e1, e2 = corners[:, 0], corners[:, 1]
+        l, h = sizes[:, 0, None], sizes[:, 1, None]
+        cos, sin = cos[:, None], sin[:, None]
+        vertices = np.stack([
+            positions[:, 0, None] + (e1*l*cos + e2*h*sin)/2,
+            positions[:, 1, None] + (e1*l*sin - e2*h*cos)/2
+        ], axis=-1)
+        return self.convert_array(vertices)
+
+    def rotated_boxes(self, positions, sizes, cos, sin, colors, filled=True):
+        """Draws many centered rotated boxes, *colors* is one color or one per box"""
+        vertices = self.box_vertices(positions, sizes, cos, sin).tolist()
+        if not isinstance(colors, list):
+            colors = [colors] * len(vertices)
+        for box, color in zip(vertices, colors):
+            self.polygon(box, color, filled=filled)
+
     def rotated_rect(self, pos, size, angle=None, cos=None, sin=None, centered=True, color=(0, 0, 255)):
         self.rotated_box(pos, size, angle=angle, cos=cos, sin=sin, centered=centered, color=color, filled=False)
 
@@ -243,41 +308,80 @@ class Window:
                 color
             )
 
+    def visible_rect(self, margin=5):
+        """Returns the world rectangle (x0, y0, x1, y1) shown on screen, grown by *margin*"""
+        half_width = self.width/2/self.zoom
+        half_height = self.height/2/self.zoom
+        return (
+            -self.offset[0] - half_width - margin,
+            -self.offset[1] - half_height - margin,
+            -self.offset[0] + half_width + margin,
+            -self.offset[1] + half_height + margin
+        )
+
+    def visible_roads(self):
+        """Returns a mask of the roads whose bounding box is on screen"""
+        roads = self.sim.roads
+        if len(self.road_boxes) != len(roads):
+            self.road_boxes = np.array([
+                (*road.points.min(axis=0), *road.points.max(axis=0)) for road in roads
+            ]).reshape(-1, 4)
+        x0, y0, x1, y1 = self.visible_rect()
+        boxes = self.road_boxes
+        return (boxes[:, 0] <= x1) & (boxes[:, 2] >= x0) & (boxes[:, 1] <= y1) & (boxes[:, 3] >= y0)
+
+    def draw_static(self):
+        """Draws the background and the roads, from a cached layer while the view does not change"""
+        key = (self.zoom, self.offset, self.width, self.height, len(self.sim.roads))
+        if key != self.static_key:
+            # The drawing functions draw on self.screen
+            screen = self.screen
+            self.screen = self.static_layer = pygame.Surface((self.width, self.height))
+            self.background(*self.bg_color)
+            self.draw_roads()
+            self.screen = screen
+            self.static_key = key
+
+        self.screen.blit(self.static_layer, (0, 0))
+
     def draw_roads(self):
-        for road in self.sim.roads:
-            # Draw road background
-            self.rotated_box(
-                road.start,
-                (road.length, 3.7),
-                cos=road.angle_cos,
-                sin=road.angle_sin,
-                color=(180, 180, 220),
-                centered=False
-            )
-            # Draw road lines
-            # self.rotated_box(
-            #     road.start,
-            #     (road.length, 0.25),
-            #     cos=road.angle_cos,
-            #     sin=road.angle_sin,
-            #     color=(0, 0, 0),
-            #     centered=False
-            # )
-
-            # Draw road arrow
-            if road.length > 5: 
-                for i in np.arange(-0.5*road.length, 0.5*road.length, 10):
-                    pos = (
-                        road.start[0] + (road.length/2 + i + 3) * road.angle_cos,
-                        road.start[1] + (road.length/2 + i + 3) * road.angle_sin
-                    )
-
-                    self.arrow(
-                        pos,
-                        (-1.25, 0.2),
-                        cos=road.angle_cos,
-                        sin=road.angle_sin
-                    )   
+        for road, visible in zip(self.sim.roads, self.visible_roads()):
+            if not visible:
+                continue
+            for start, length, cos, sin in road.segments():
+                # Draw road background
+                self.rotated_box(
+                    start,
+                    (length, 3.7),
+                    cos=cos,
+                    sin=sin,
+                    color=(180, 180, 220),
+                    centered=False
+                )
+                # Draw road lines
+                # self.rotated_box(
+                #     start,
+                #     (length, 0.25),
+                #     cos=cos,
+                #     sin=sin,
+                #     color=(0, 0, 0),
+                #     centered=False
+                # )
+
+                # Draw road arrow
+                if length > 5: 
+                    for i in np.arange(-0.5*length, 0.5*length, 10):
+                        pos = (
+                            start[0] + (length/2 + i + 3) * cos,
+                            start[1] + (length/2 + i + 3) * sin
+                        )
+
+                        self.arrow(
+                            pos,
+                            (-1.25, 0.2),
+                            cos=cos,
+                            sin=sin
+                        )   
             
 
 
@@ -285,38 +389,80 @@ class Window:
 
     def draw_vehicle(self, vehicle, road):
         l, h = vehicle.l,  2
-        sin, cos = road.angle_sin, road.angle_cos
+        cos, sin = road.heading(vehicle.x)
 
-        x = road.start[0] + cos * vehicle.x 
-        y = road.start[1] + sin * vehicle.x 
+        x, y = road.position(vehicle.x)
 
         self.rotated_box((x, y), (l, h), cos=cos, sin=sin, centered=True)
 
-    def draw_vehicles(self):
-        for road in self.sim.roads:
-            # Draw vehicles
-            for vehicle in road.vehicles:
-                self.draw_vehicle(vehicle, road)
+    def vehicle_arrays(self):
+        """Returns the positions, headings and lengths of the vehicles on screen"""
+        snapshot = self.snapshot
+        visible = self.visible_roads()[snapshot.road_ids]
+        road_ids, xs, lengths = snapshot.road_ids[visible], snapshot.xs[visible], snapshot.lengths[visible]
+
+        network = self.sim.network
+        positions = network.world_positions(road_ids, xs)
+
+        x0, y0, x1, y1 = self.visible_rect()
+        on_screen = (positions[:, 0] >= x0) & (positions[:, 0] <= x1) & (positions[:, 1] >= y0) & (positions[:, 1] <= y1)
+        road_ids, xs, positions, lengths = road_ids[on_screen], xs[on_screen], positions[on_screen], lengths[on_screen]
+        return positions, network.world_headings(road_ids, xs), lengths
+
+    def draw_vehicles(self, color=(0, 0, 255)):
+        positions, headings, lengths = self.vehicle_arrays()
+        if len(positions) == 0:
+            return
+
+        mode = self.vehicle_mode
+        if self.point_mode_above is not None and len(positions) > self.point_mode_above:
+            mode = "point"
+
+        if mode == "point":
+            # Set the pixels of all vehicles at once
+            points = self.convert_array(positions)
+            inside = (points[:, 0] >= 0) & (points[:, 0] < self.width) & (points[:, 1] >= 0) & (points[:, 1] < self.height)
+            pixels = pygame.surfarray.pixels3d(self.screen)
+            pixels[points[inside, 0], points[inside, 1]] = color
+            del pixels
+        elif mode == "line":
+            # From the rear to the front of every vehicle
+            half = (lengths/2)[:, None] * headings
+            rears = self.convert_array(positions - half).tolist()
+            fronts = self.convert_array(positions + half).tolist()
+            for rear, front in zip(rears, fronts):
+                self.line(rear, front, color)
+        else:
+            sizes = np.stack([lengths, np.full(len(lengths), 2)], axis=1)
+            self.rotated_boxes(positions, sizes, headings[:, 0], headings[:, 1], color)
 
     def draw_signals(self):
-        for signal in self.sim.traffic_signals:
-            for i in range(len(signal.roads)):
-                color = (0, 255, 0) if signal.current_cycle[i] else (255, 0, 0)
-                for road in signal.roads[i]:
-                    a = 0
-                    position = (
-                        (1-a)*road.end[0] + a*road.start[0],        
-                        (1-a)*road.end[1] + a*road.start[1]
-                    )
-                    self.rotated_box(
-                        position,
-                        (1, 3),
-                        cos=road.angle_cos, sin=road.angle_sin,
-                        color=color)
+        packed = self.sim.network.packed
+        positions = []
+        headings = []
+        colors = []
+        groups = [group for signal in self.sim.network.signals for group in signal]
+        for group, green in zip(groups, self.snapshot.signals):
+            color = (0, 255, 0) if green else (255, 0, 0)
+            for i in group:
+                positions.append(packed['ends'][i])
+                headings.append(packed['headings'][i])
+                colors.append(color)
+        if not positions:
+            return
+
+        positions, headings = np.array(positions, dtype=float), np.array(headings)
+        x0, y0, x1, y1 = self.visible_rect()
+        on_screen = (positions[:, 0] >= x0) & (positions[:, 0] <= x1) & (positions[:, 1] >= y0) & (positions[:, 1] <= y1)
+        sizes = np.tile([1, 3], (np.count_nonzero(on_screen), 1))
+        self.rotated_boxes(
+            positions[on_screen], sizes, headings[on_screen, 0], headings[on_screen, 1],
+            [color for color, shown in zip(colors, on_screen) if shown]
+        )
 
     def draw_plot(self):
-        self.plot_x.append(self.sim.t)
-        self.plot_y.append(self.sim.metrics["avg_speed"])
+        self.plot_x.append(self.snapshot.t)
+        self.plot_y.append(self.snapshot.avg_speed)
 
         
         #plt.plot(self.plot_x, self.plot_y)
@@ -324,25 +470,34 @@ class Window:
 
 
     def draw_status(self):
-        text_fps = self.text_font.render(f't={self.sim.t:.5}', False, (0, 0, 0))
-        text_frc = self.text_font.render(f'n={self.sim.frame_count}', False, (0, 0, 0))
-        text_met = self.text_font.render(f'avg_speed={self.sim.metrics["avg_speed"]}', False, (0, 0, 0))
+        text_fps = self.text_font.render(f't={self.snapshot.t:.5}', False, (0, 0, 0))
+        text_frc = self.text_font.render(f'n={self.snapshot.frame_count}', False, (0, 0, 0))
+        text_met = self.text_font.render(f'avg_speed={self.snapshot.avg_speed}', False, (0, 0, 0))
         
         self.screen.blit(text_fps, (0, 0))
         self.screen.blit(text_frc, (100, 0))
         self.screen.blit(text_met, (200, 0))
 
 
+    def current_snapshot(self):
+        """Returns the state to draw, from the source if there is one"""
+        if self.source is None:
+            return Snapshot.capture(self.sim)
+        snapshot = self.source.snapshot()
+        # Nothing to draw until the source publishes its first snapshot
+        return Snapshot() if snapshot is None else snapshot
+
     def draw(self):
-        # Fill background
-        self.background(*self.bg_color)
+        self.snapshot = self.current_snapshot()
+
+        # Background and roads
+        self.draw_static()
 
         # Major and minor grid and axes
         # self.draw_grid(10, (220,220,220))
         # self.draw_grid(100, (200,200,200))
         # self.draw_axes()
 
-        self.draw_roads()
         self.draw_vehicles()
         self.draw_signals()
 